@@ -7,7 +7,7 @@ bot.py
 Что делает:
 - корректно поднимает Django (DJANGO_SETTINGS_MODULE + django.setup);
 - гарантирует колонку is_public у таблицы events;
-- создаёт Updater/Dispatcher (python-telegram-bot v13.x);
+- создаёт Updater/Dispatcher (python-telegram-bot v13.x) с очередью исходящих сообщений;
 - регистрирует все команды/хендлеры (события, встречи, публичность, экспорт);
 - настраивает меню команд;
 - запускает polling-цикл.
@@ -96,21 +96,34 @@ django.setup()  # noqa: E402
 # Дальше — обычные импорты бота
 # ---------------------------------------------------------------------------
 import logging  # noqa: E402
+import threading  # noqa: E402
+import time  # noqa: E402
 from typing import NoReturn  # noqa: E402
 
-from telegram import Update  # noqa: E402
+from telegram import Bot, Update  # noqa: E402
 from telegram.ext import (  # noqa: E402
     Updater,
-    CommandHandler,
     MessageHandler,
     Filters,
     CallbackQueryHandler,
     CallbackContext,
 )
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError, TimedOut  # noqa: E402
+from telegram.ext import messagequeue as mq  # noqa: E402
+from telegram.utils.request import Request  # noqa: E402
+from cachetools import TTLCache  # noqa: E402
 
 import bot_secrets  # содержит API_TOKEN  # noqa: E402
-from db import get_connection, ensure_is_public_column  # noqa: E402
-from tgapp.core import setup_bot_commands, logger as app_logger  # noqa: E402
+from db import get_connection, ensure_events_indexes, ensure_is_public_column  # noqa: E402
+from tgapp.core import (  # noqa: E402
+    COMMAND_FILTER,
+    command_router,
+    flush_stats,
+    per_user_serial,
+    setup_bot_commands,
+    with_fresh_db,
+    logger as app_logger,
+)
 from tgapp import handlers_events as ev  # noqa: E402
 from tgapp import handlers_appointments as appt  # noqa: E402
 
@@ -125,6 +138,127 @@ logging.basicConfig(
 )
 log = logging.getLogger("calendar_bot")
 
+# Размер пула воркеров run_async. Каждый поток держит своё соединение с БД
+# (Django-ORM и psycopg2), поэтому пул ограничен и настраивается из окружения.
+BOT_WORKERS = max(1, int(os.getenv("BOT_WORKERS", "8")))
+
+
+# ---------------------------------------------------------------------------
+# Бот с очередью исходящих сообщений
+# ---------------------------------------------------------------------------
+
+class MQBot(Bot):
+    """
+    Bot, у которого send_message проходит через MessageQueue (token bucket).
+
+    Очередь сглаживает всплески ответов: не больше 29 сообщений/сек на бота
+    и 20 сообщений/мин в групповой чат (chat_id < 0 помечается isgroup) —
+    лимиты Telegram, после превышения которых Bot API отвечает 429 и требует
+    паузы. reply_text хендлеров вызывает bot.send_message, поэтому идёт через
+    очередь автоматически. (telegram.ext.messagequeue объявлен устаревшим
+    с PTB 13.3, но в закреплённой версии 13.13 работает; при переходе на
+    PTB 20 его заменит встроенный rate limiter.)
+
+    send_message в очереди возвращает Promise и вызывающему не бросает:
+    ошибки логируются в потоке очереди. Если результат отправки важен
+    (например, доставлено ли приглашение), вызывайте с queued=False —
+    тогда отправка идёт сразу в текущем потоке (с теми же повторами) и
+    возвращает Message или None при неудаче.
+
+    Подсказки из dedup_texts (повтор неверного ввода, «Операция отменена.»)
+    с той же клавиатурой в один чат чаще, чем раз в DEDUP_WINDOW секунд,
+    схлопываются в одну: если пользователь шлёт подряд «Отмена» или неверный
+    ID, подсказка уходит один раз, а не на каждое сообщение. Остальные тексты
+    (результаты, подтверждения) и отправки с queued=False не схлопываются.
+    Подавленный повтор возвращает None (без Promise).
+
+    Если Telegram всё же ответил 429 (RetryAfter), поток очереди выжидает
+    указанную паузу и повторяет отправку; сетевые сбои повторяются с
+    экспоненциальной задержкой. Таймаут не повторяется: запрос мог дойти,
+    и повтор продублировал бы сообщение.
+    """
+
+    DEDUP_WINDOW = 1.0
+    SEND_ATTEMPTS = 3
+
+    def __init__(
+        self,
+        *args,
+        mqueue: mq.MessageQueue | None = None,
+        dedup_texts: frozenset[str] = frozenset(),
+        **kwargs,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self._is_messages_queued_default = True
+        self._msg_queue = mqueue or mq.MessageQueue(all_burst_limit=29, all_time_limit_ms=1017)
+        self._dedup_texts = dedup_texts
+        # chat_id -> (текст, клавиатура) последнего сообщения; запись живёт
+        # DEDUP_WINDOW и сама исчезает, так что словарь не растёт с числом чатов.
+        self._last_sent: TTLCache = TTLCache(maxsize=100_000, ttl=self.DEDUP_WINDOW)
+        self._last_sent_lock = threading.Lock()
+
+    def stop_queue(self) -> None:
+        """Остановить поток очереди (при завершении бота)."""
+        self._msg_queue.stop()
+
+    def _is_repeat(self, chat_id, text, reply_markup) -> bool:
+        """
+        Это подсказка из dedup_texts, и предыдущим сообщением в этот чат
+        (в пределах DEDUP_WINDOW) ушла она же с той же клавиатурой?
+        Запоминается каждое отправляемое сообщение: подсказка после другого
+        ответа уже не повтор.
+        """
+        with self._last_sent_lock:
+            last = self._last_sent.get(chat_id)
+            # Клавиатуры — общие объекты модулей (CANCEL_KB и т.п.): сравниваем по
+            # идентичности; другая клавиатура — новое сообщение, отправляем сразу
+            if (
+                text in self._dedup_texts
+                and last is not None
+                and last[0] == text
+                and last[1] is reply_markup
+            ):
+                return True
+            self._last_sent[chat_id] = (text, reply_markup)
+            return False
+
+    def send_message(self, chat_id, text, *args, **kwargs):
+        if kwargs.get("queued", True) and self._is_repeat(chat_id, text, kwargs.get("reply_markup")):
+            log.debug("send_message: повтор в chat_id=%s подавлен", chat_id)
+            return None
+        kwargs.setdefault("isgroup", isinstance(chat_id, int) and chat_id < 0)
+        return self._send_queued(chat_id, text, *args, **kwargs)
+
+    @mq.queuedmessage
+    def _send_queued(self, chat_id, *args, **kwargs):
+        # Выполняется в потоке очереди: исключение отсюда никто не прочитает,
+        # поэтому неудачи логируем здесь же.
+        # Пауза нужна только перед следующей попыткой: после последней
+        # неудачи сразу выходим, не задерживая очередь впустую.
+        for attempt in range(self.SEND_ATTEMPTS):
+            last = attempt == self.SEND_ATTEMPTS - 1
+            try:
+                return super().send_message(chat_id, *args, **kwargs)
+            except RetryAfter as e:
+                log.warning("send_message: 429 для chat_id=%s, пауза %s с", chat_id, e.retry_after)
+                if not last:
+                    time.sleep(e.retry_after)
+            except (BadRequest, TimedOut) as e:
+                log.warning("send_message: chat_id=%s не доставлено: %s", chat_id, e)
+                return None
+            except NetworkError as e:
+                log.warning("send_message: сетевая ошибка для chat_id=%s: %s", chat_id, e)
+                if not last:
+                    time.sleep(0.5 * 2 ** attempt)
+            except TelegramError as e:
+                # Unauthorized (бот заблокирован), ChatMigrated и прочее:
+                # повтор не поможет, но и молча терять ошибку нельзя.
+                log.warning("send_message: chat_id=%s не доставлено (%s): %s",
+                            chat_id, type(e).__name__, e)
+                return None
+        log.warning("send_message: chat_id=%s не доставлено после %s попыток", chat_id, self.SEND_ATTEMPTS)
+        return None
+
 
 # ---------------------------------------------------------------------------
 # Глобальный обработчик ошибок
@@ -151,36 +285,29 @@ def _register_handlers(updater: Updater) -> None:
     """
     dp = updater.dispatcher
 
-    # --- Базовые команды ---
-    dp.add_handler(CommandHandler("start", ev.start))
-    dp.add_handler(CommandHandler("help", ev.help_command))
-    dp.add_handler(CommandHandler("register", ev.register_command))
-    dp.add_handler(CommandHandler("cancel", ev.cancel_command))
-
-    # --- События (CRUD) ---
-    dp.add_handler(CommandHandler("display_events", ev.display_events_handler))
-    dp.add_handler(CommandHandler("read_event", ev.read_event_handler))
-    dp.add_handler(CommandHandler("create_event", ev.create_event_start))
-    dp.add_handler(CommandHandler("edit_event", ev.edit_event_start_or_inline))
-    dp.add_handler(CommandHandler("delete_event", ev.delete_event_start_or_inline))
-
-    # --- Публичные события (Task 5) ---
-    dp.add_handler(CommandHandler("share_event", ev.share_event_start))
-    dp.add_handler(CommandHandler("my_public", ev.list_my_public_command))
-    dp.add_handler(CommandHandler("public_of", ev.public_of_start))
-    dp.add_handler(CallbackQueryHandler(ev.fsm_cancel_callback, pattern=r"^fsm:cancel$"))
-
-    # --- Встречи и приглашения ---
-    dp.add_handler(CommandHandler("invite", appt.invite_start))
-    dp.add_handler(CallbackQueryHandler(appt.appointment_decision_handler, pattern=r"^appt:"))
-
-    # --- Профиль и календарь ---
-    dp.add_handler(CommandHandler("login", ev.login_command))
-    dp.add_handler(CommandHandler("calendar", ev.calendar_command))
-    dp.add_handler(CommandHandler("export", ev.export_command))  # Task 6: CSV/JSON
-
-    # --- FSM-тексты (не команды) ---
-    dp.add_handler(MessageHandler(Filters.text & ~Filters.command, ev.text_router))
+    # run_async=True: обращения к БД и reply_text выполняются в пуле воркеров
+    # Dispatcher и не блокируют разбор остальных апдейтов на время round-trip'ов.
+    # Команды, начинающие диалог, /cancel, inline-«Отмена» и FSM-роутер меняют
+    # состояние диалога: они идут
+    # через per_user_serial — по порядку для одного пользователя, параллельно
+    # для разных (очереди по user_id на общем пуле, см. tgapp.core).
+
+    # --- Команды: один хендлер, поиск по имени в таблице (tgapp.core.command_router) ---
+    commands = {
+        **ev.COMMANDS,                               # события, профиль, публичность, экспорт
+        "invite": (per_user_serial(appt.invite_start), False),  # встречи (меняет состояние диалога)
+    }
+    dp.add_handler(MessageHandler(COMMAND_FILTER, command_router(commands)))
+
+    # --- Callback-кнопки ---
+    dp.add_handler(CallbackQueryHandler(per_user_serial(ev.fsm_cancel_callback), pattern=r"^fsm:cancel$"))
+    dp.add_handler(CallbackQueryHandler(with_fresh_db(ev.events_page_callback), pattern=r"^evp:", run_async=True))
+    dp.add_handler(
+        CallbackQueryHandler(with_fresh_db(appt.appointment_decision_handler), pattern=r"^(a|appt):", run_async=True)
+    )
+
+    # --- FSM-тексты (не команды: их уже забрал command_router выше) ---
+    dp.add_handler(MessageHandler(Filters.text, per_user_serial(ev.text_router)))
 
     # --- Ошибки ---
     dp.add_error_handler(error_handler)
@@ -197,20 +324,28 @@ def main() -> NoReturn:
     Инициализация и запуск Telegram-бота.
 
     Шаги:
-    1) Проверка схемы БД (is_public для events);
+    1) Проверка схемы БД (is_public и индексы для events);
     2) Создание Updater/Dispatcher, меню команд;
     3) Регистрация хендлеров;
     4) Запуск polling.
     """
-    # 1) База данных: колонка для публичности событий
+    # 1) База данных: колонка для публичности событий и индексы списков
     conn = get_connection()
     ensure_is_public_column(conn)
+    ensure_events_indexes(conn)
+    conn.close()
 
     # 2) Updater / Dispatcher
     if not getattr(bot_secrets, "API_TOKEN", None):
         raise RuntimeError("bot_secrets.API_TOKEN не задан")
 
-    updater = Updater(token=bot_secrets.API_TOKEN, use_context=True)
+    # Пул HTTP-соединений: воркеры run_async + поток очереди + polling.
+    bot = MQBot(
+        token=bot_secrets.API_TOKEN,
+        request=Request(con_pool_size=BOT_WORKERS + 4),
+        dedup_texts=ev.REPEATABLE_REPLIES,
+    )
+    updater = Updater(bot=bot, workers=BOT_WORKERS, use_context=True)
 
     # Меню /help
     setup_bot_commands(updater.bot)
@@ -224,6 +359,8 @@ def main() -> NoReturn:
         "BOT запущен: FSM, встречи, публикации, экспорт, PostgreSQL/Django активны."
     )
     updater.idle()
+    bot.stop_queue()
+    flush_stats()
 
 
 # ---------------------------------------------------------------------------
@@ -16,6 +16,8 @@ db.py
 Важно:
 - Подключение (get_connection) использует autocommit=True, чтобы в учебной
   среде не ловить подвисшие транзакции.
+- Хендлеры бота берут соединения из пула (borrow_connection) вместо
+  нового подключения (TCP + аутентификация) на каждое сообщение.
 - В продакшене autocommit обычно отключают и работают через явные транзакции.
 """
 
@@ -23,11 +25,15 @@ from __future__ import annotations
 
 import os
 import logging
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Iterator
 
 import psycopg2
 from psycopg2 import Error as PGError
 from psycopg2.extensions import connection as PGConnection
+from psycopg2.pool import ThreadedConnectionPool
 
 logger = logging.getLogger(__name__)
 
@@ -35,21 +41,27 @@ logger = logging.getLogger(__name__)
 # --------------------------------------------------------------------------- #
 # Подключение к БД
 # --------------------------------------------------------------------------- #
+def _connect_params() -> dict:
+    """Параметры подключения из переменных окружения."""
+    return {
+        # ВАЖНО: 'db' для Docker, 'localhost' для локального
+        "host": os.getenv("DB_HOST", "db"),
+        "database": os.getenv("DB_NAME", "calendar_db"),
+        "user": os.getenv("DB_USER", "calendar_user"),
+        "password": os.getenv("DB_PASSWORD", "calendar_password"),
+        "port": int(os.getenv("DB_PORT", "5432")),
+    }
+
+
 def get_connection() -> PGConnection:
     """
     Установить подключение к PostgreSQL и вернуть объект соединения.
 
     Читает хост, порт и данные из переменных окружения,
     если они есть. По умолчанию использует 'localhost' для локальной разработки.
+    Закрывать соединение должен вызывающий; в хендлерах используйте borrow_connection.
     """
-    conn: PGConnection = psycopg2.connect(
-        # ВАЖНО: 'db' для Docker, 'localhost' для локального
-        host=os.getenv("DB_HOST", "db"),
-        database=os.getenv("DB_NAME", "calendar_db"),
-        user=os.getenv("DB_USER", "calendar_user"),
-        password=os.getenv("DB_PASSWORD", "calendar_password"),
-        port=int(os.getenv("DB_PORT", "5432")),
-    )
+    conn: PGConnection = psycopg2.connect(**_connect_params())
     conn.autocommit = True
     logger.info(
         "DB: подключение установлено (host=%s, db=%s, autocommit=%s).",
@@ -58,6 +70,50 @@ def get_connection() -> PGConnection:
     return conn
 
 
+# --------------------------------------------------------------------------- #
+# Пул соединений
+# --------------------------------------------------------------------------- #
+# Создаётся лениво при первом обращении (импорт db не требует доступной БД).
+# maxconn должен покрывать все потоки, работающие с БД одновременно:
+# воркеры run_async (BOT_WORKERS) + потоки FSM (FSM_WORKERS) + поток статистики.
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "16"))
+
+_POOL: ThreadedConnectionPool | None = None
+_POOL_LOCK = threading.Lock()
+
+
+def _get_pool() -> ThreadedConnectionPool:
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, **_connect_params())
+                logger.info("DB: пул соединений создан (min=%s, max=%s).", DB_POOL_MIN, DB_POOL_MAX)
+    return _POOL
+
+
+@contextmanager
+def borrow_connection() -> Iterator[PGConnection]:
+    """
+    Взять соединение из пула на время блока with и вернуть его обратно.
+
+    Соединение в режиме autocommit, как у get_connection. Разорванное
+    соединение (conn.closed) при возврате выбрасывается из пула.
+
+    Исключения:
+        psycopg2.pool.PoolError: все DB_POOL_MAX соединений заняты.
+    """
+    pool = _get_pool()
+    conn = pool.getconn()
+    try:
+        if not conn.autocommit:
+            conn.autocommit = True
+        yield conn
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+
+
 # --------------------------------------------------------------------------- #
 # Служебное: гарантировать наличие колонки is_public (Task 5)
 # --------------------------------------------------------------------------- #
@@ -107,6 +163,38 @@ def ensure_is_public_column(conn: PGConnection) -> None:
             pass
 
 
+# --------------------------------------------------------------------------- #
+# Служебное: индексы для выборок событий по владельцу
+# --------------------------------------------------------------------------- #
+def ensure_events_indexes(conn: PGConnection) -> None:
+    """
+    Гарантирует индексы для списков событий пользователя (/calendar, /my_public,
+    /public_of): выборка по user_id в порядке date, time, id читается из индекса,
+    и LIMIT останавливает сканирование на первых строках. Для публичных событий —
+    частичный индекс по is_public.
+    Идемпотентно (IF NOT EXISTS); ошибки только логируются.
+
+    Параметры:
+        conn: psycopg2 connection.
+    """
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "CREATE INDEX IF NOT EXISTS events_user_dt_idx "
+                "ON public.events (user_id, date, time, id)"
+            )
+            cur.execute(
+                "CREATE INDEX IF NOT EXISTS events_user_public_dt_idx "
+                "ON public.events (user_id, date, time, id) WHERE is_public"
+            )
+    except Exception as e:  # noqa: BLE001
+        logger.warning("Не удалось создать индексы events: %s", e)
+        try:
+            conn.rollback()
+        except Exception:  # noqa: BLE001
+            pass
+
+
 # --------------------------------------------------------------------------- #
 # Пользователи
 # --------------------------------------------------------------------------- #
@@ -170,12 +258,25 @@ def register_user(conn: PGConnection, tg_user_id: int, username: str, first_name
 # --------------------------------------------------------------------------- #
 # Календарь (events)
 # --------------------------------------------------------------------------- #
+def _validate_date_time(date_str: str, time_str: str) -> None:
+    """Проверить форматы 'ГГГГ-ММ-ДД' и 'ЧЧ:ММ'; иначе ValueError с текстом для пользователя."""
+    try:
+        datetime.strptime(date_str, "%Y-%m-%d")
+        datetime.strptime(time_str, "%H:%M")
+    except ValueError as e:
+        raise ValueError(
+            "Дата должна быть в формате ГГГГ-ММ-ДД, "
+            "время — ЧЧ:ММ."
+        ) from e
+
+
 class Calendar:
     """
     Высокоуровневый интерфейс к событиям календаря (таблица events).
 
     Методы:
         create_event(...) -> int
+        create_event_ensuring_user(...) -> int
         read_event(...) -> str | None
         edit_event(...) -> bool
         delete_event(...) -> bool
@@ -220,14 +321,7 @@ class Calendar:
             ValueError: если формат даты/времени неверный.
             PGError: внутренняя ошибка PostgreSQL.
         """
-        try:
-            datetime.strptime(date_str, "%Y-%m-%d")
-            datetime.strptime(time_str, "%H:%M")
-        except ValueError as e:
-            raise ValueError(
-                "Дата должна быть в формате ГГГГ-ММ-ДД, "
-                "время — ЧЧ:ММ."
-            ) from e
+        _validate_date_time(date_str, time_str)
 
         try:
             with self.conn.cursor() as cur:
@@ -246,6 +340,56 @@ class Calendar:
             logger.exception("DB: create_event ошибка user_id=%s", user_id)
             raise
 
+    def create_event_ensuring_user(
+        self,
+        user_id: int,
+        name: str,
+        date_str: str,
+        time_str: str,
+        details: str,
+        username: str,
+        first_name: str,
+    ) -> int:
+        """
+        Создать событие и, если нужно, строку пользователя — за один запрос.
+
+        INSERT в users (ON CONFLICT DO NOTHING) и INSERT в events выполняются
+        одним оператором с CTE: один round trip и одна транзакция.
+
+        Параметры и исключения — как у create_event; дополнительно:
+            username: @username в Telegram.
+            first_name: имя (first_name) в Telegram.
+
+        Возвращает:
+            ID вставленной записи (events.id).
+        """
+        _validate_date_time(date_str, time_str)
+
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    """
+                    WITH u AS (
+                        INSERT INTO users (tg_user_id, username, first_name)
+                        VALUES (%s, %s, %s)
+                        ON CONFLICT (tg_user_id) DO NOTHING
+                    )
+                    INSERT INTO events (name, date, time, details, user_id)
+                    VALUES (%s, %s, %s, %s, %s)
+                    RETURNING id;
+                    """,
+                    (
+                        user_id, username, first_name,
+                        name, date_str, time_str, details, user_id,
+                    ),
+                )
+                eid = cur.fetchone()[0]
+            logger.info("DB: create_event_ensuring_user ok user_id=%s id=%s", user_id, eid)
+            return eid
+        except PGError:
+            logger.exception("DB: create_event_ensuring_user ошибка user_id=%s", user_id)
+            raise
+
     def read_event(self, user_id: int, event_id: int) -> str | None:
         """
         Получить текстовое описание события пользователя.
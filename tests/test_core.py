@@ -0,0 +1,140 @@
+import threading
+import time
+import types
+
+from tgapp import core
+from tgapp.core import command_router, parse_id, per_user_serial
+
+
+# --- parse_id ---
+
+def test_parse_id_accepts_ascii_digits():
+    assert parse_id("42") == 42
+    assert parse_id("  7 ") == 7
+    assert parse_id("0") == 0
+
+
+def test_parse_id_rejects_what_int_would_accept():
+    # int() пропустил бы знак, подчёркивания и цифры других алфавитов
+    for text in ("", " ", "-1", "+1", "1_000", "١٢", "１２", "1.0", "12a"):
+        assert parse_id(text) is None, text
+
+
+# --- command_router ---
+
+class _Dispatcher:
+    def __init__(self):
+        self.async_calls = []
+
+    def run_async(self, func, *args, update=None):
+        self.async_calls.append((func, args, update))
+
+
+def _router_ctx():
+    return types.SimpleNamespace(
+        bot=types.SimpleNamespace(username="CalendarBot"),
+        dispatcher=_Dispatcher(),
+        args=None,
+    )
+
+
+def _cmd_update(text):
+    return types.SimpleNamespace(effective_message=types.SimpleNamespace(text=text))
+
+
+def test_command_router_sets_args_and_calls_inline():
+    calls = []
+    route = command_router({"show": (lambda u, c: calls.append(list(c.args)), False)})
+    ctx = _router_ctx()
+
+    route(_cmd_update("/show 2025-12-31 extra"), ctx)
+    assert calls == [["2025-12-31", "extra"]]
+    assert ctx.dispatcher.async_calls == []
+
+
+def test_command_router_is_case_insensitive_and_checks_bot_name():
+    calls = []
+    route = command_router({"help": (lambda u, c: calls.append(c.args), False)})
+    ctx = _router_ctx()
+
+    route(_cmd_update("/HELP"), ctx)
+    route(_cmd_update("/help@calendarbot"), ctx)
+    route(_cmd_update("/help@other_bot"), ctx)   # команда другому боту — не наша
+    assert calls == [[], []]
+
+
+def test_command_router_ignores_unknown_commands():
+    calls = []
+    route = command_router({"help": (lambda u, c: calls.append(1), False)})
+    ctx = _router_ctx()
+
+    route(_cmd_update("/unknown arg"), ctx)
+    assert calls == []
+    assert ctx.dispatcher.async_calls == []
+
+
+def test_command_router_run_async_goes_through_dispatcher():
+    def handler(update, context):
+        raise AssertionError("должен вызываться через run_async")
+
+    route = command_router({"events": (handler, True)})
+    ctx = _router_ctx()
+    upd = _cmd_update("/events 5")
+
+    route(upd, ctx)
+    [(func, args, update)] = ctx.dispatcher.async_calls
+    # В пул уходит хендлер, обёрнутый проверкой соединения с БД (with_fresh_db)
+    assert func.__wrapped__ is handler
+    assert args == (upd, ctx) and update is upd
+    assert ctx.args == ["5"]
+
+
+# --- per_user_serial ---
+
+def _wait(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "очередь не разобрана вовремя"
+        time.sleep(0.01)
+
+
+def test_per_user_serial_keeps_order_for_one_user():
+    seen = []
+    lock = threading.Lock()
+
+    def handler(update, context):
+        # Первые апдейты «медленнее» последующих: без очереди порядок бы сломался
+        time.sleep(0.02 * (5 - update.n))
+        with lock:
+            seen.append((update.effective_user.id, update.n))
+
+    wrapped = per_user_serial(handler)
+    for n in range(5):
+        for uid in (1, 2):
+            wrapped(types.SimpleNamespace(effective_user=types.SimpleNamespace(id=uid), n=n), None)
+
+    _wait(lambda: len(seen) == 10)
+    for uid in (1, 2):
+        assert [n for u, n in seen if u == uid] == list(range(5))
+    _wait(lambda: not core._USER_QUEUES)
+
+
+def test_per_user_serial_passes_errors_to_dispatcher():
+    errors = []
+    done = threading.Event()
+
+    def failing(update, context):
+        raise ValueError("boom")
+
+    def after(update, context):
+        done.set()
+
+    ctx = types.SimpleNamespace(
+        dispatcher=types.SimpleNamespace(dispatch_error=lambda upd, exc: errors.append(exc))
+    )
+    upd = types.SimpleNamespace(effective_user=types.SimpleNamespace(id=3))
+    per_user_serial(failing)(upd, ctx)
+    per_user_serial(after)(upd, ctx)   # очередь не застревает после исключения
+
+    assert done.wait(5)
+    assert len(errors) == 1 and isinstance(errors[0], ValueError)
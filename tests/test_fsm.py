@@ -0,0 +1,124 @@
+from datetime import datetime
+
+import pytest
+
+from tgapp.fsm import CachedStorage, MemoryStorage, parse_date, parse_time
+
+
+# --- parse_date / parse_time: те же ответы, что у прежней проверки через strptime ---
+
+def _strptime_ok(text, fmt):
+    s = (text or "").strip()
+    try:
+        datetime.strptime(s, fmt)
+        return s
+    except ValueError:
+        return None
+
+
+@pytest.mark.parametrize("text", [
+    "2025-11-03", "2025-1-3", "2024-02-29", "2025-02-29", "2025-13-01",
+    "2025-00-10", "2025-10-00", "2025-001-01", "25-01-01", "02025-01-01",
+    " 2025-11-03 ", "2025/11/03", "2025-11-03x", "0001-01-01", "0000-01-01",
+    "9999-12-31", "+2025-11-03", "",
+])
+def test_parse_date_matches_strptime(text):
+    assert parse_date(text) == _strptime_ok(text, "%Y-%m-%d")
+
+
+@pytest.mark.parametrize("text", [
+    "09:05", "9:5", "23:59", "24:00", "00:00", "12:60", " 09:05 ",
+    "09.05", "009:05", "09:005", "-1:00", "09:5x", "",
+])
+def test_parse_time_matches_strptime(text):
+    assert parse_time(text) == _strptime_ok(text, "%H:%M")
+
+
+def test_parse_date_rejects_non_ascii_digits():
+    # Единственное намеренное отличие: strptime принял бы полноширинные цифры
+    assert parse_date("２０２５-11-03") is None
+
+
+# --- CachedStorage ---
+
+class _Backend(MemoryStorage):
+    """MemoryStorage со счётчиком обращений и touch()."""
+
+    def __init__(self):
+        super().__init__()
+        self.gets = 0
+        self.touched = []
+        self.on_get = None
+
+    def get(self, user_id):
+        self.gets += 1
+        state = super().get(user_id)
+        if self.on_get:
+            self.on_get()
+        return state
+
+    def touch(self, user_id):
+        self.touched.append(user_id)
+
+
+def _flush(storage):
+    """Дождаться фоновых записей в backend."""
+    storage._writer.submit(lambda: None).result(timeout=5)
+
+
+def test_cached_storage_reads_backend_once():
+    backend = _Backend()
+    backend.set(1, {"flow": "CREATE", "step": "WAIT_NAME", "data": {}})
+    storage = CachedStorage(backend, ttl=60)
+
+    assert storage.get(1)["step"] == "WAIT_NAME"
+    assert storage.get(1)["step"] == "WAIT_NAME"
+    assert storage.get(2) is None
+    assert storage.get(2) is None   # отсутствие тоже кэшируется
+    assert backend.gets == 2
+
+
+def test_cached_storage_writes_through_in_background():
+    backend = _Backend()
+    storage = CachedStorage(backend, ttl=60)
+
+    storage.set(1, {"flow": "EDIT", "step": "WAIT_ID", "data": {"x": 1}})
+    assert storage.get(1)["data"] == {"x": 1}
+    _flush(storage)
+    assert backend._states[1]["step"] == "WAIT_ID"
+
+    storage.delete(1)
+    assert storage.get(1) is None
+    _flush(storage)
+    assert 1 not in backend._states
+
+
+def test_cached_storage_returns_copies():
+    storage = CachedStorage(_Backend(), ttl=60)
+    storage.set(1, {"flow": "CREATE", "step": "WAIT_NAME", "data": {}})
+
+    storage.get(1)["data"]["name"] = "без set_state"
+    assert storage.get(1)["data"] == {}
+
+
+def test_cached_storage_miss_does_not_overwrite_fresh_set():
+    backend = _Backend()
+    storage = CachedStorage(backend, ttl=60)
+    fresh = {"flow": "CREATE", "step": "WAIT_DATE", "data": {}}
+    # Пока get() читает backend (там пусто), другой поток успевает вызвать set()
+    backend.on_get = lambda: storage.set(1, fresh)
+
+    storage.get(1)
+    backend.on_get = None
+    assert storage.get(1)["step"] == "WAIT_DATE"
+
+
+def test_cached_storage_hit_extends_backend_ttl():
+    backend = _Backend()
+    storage = CachedStorage(backend, ttl=60)
+    storage.set(1, {"flow": "CREATE", "step": "WAIT_NAME", "data": {}})
+
+    storage.get(1)
+    storage.get(2)   # отсутствующее состояние продлевать нечего
+    _flush(storage)
+    assert backend.touched == [1]
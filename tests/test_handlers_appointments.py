@@ -0,0 +1,29 @@
+import pytest
+
+from tgapp import handlers_appointments as appt
+
+
+@pytest.mark.parametrize("appt_id", [0, 1, 255, 256, 70_000, 2**40 + 7])
+@pytest.mark.parametrize("code, action", [("o", "ok"), ("n", "no")])
+def test_pack_unpack_roundtrip(appt_id, code, action):
+    data = appt._pack_cb(code, appt_id)
+    assert data.startswith(f"a:{code}:")
+    assert len(data.encode()) <= 64   # лимит callback_data в Telegram
+    assert appt._unpack_cb(data) == (action, appt_id)
+
+
+def test_unpack_legacy_format():
+    # Кнопки в уже отправленных сообщениях: «appt:ok|no:<id>»
+    assert appt._unpack_cb("appt:ok:123") == ("ok", 123)
+    assert appt._unpack_cb("appt:no:7") == ("no", 7)
+    assert appt._unpack_cb("appt:ok:abc") == ("ok", None)
+
+
+@pytest.mark.parametrize("data", ["", "a:o", "a:x:AQ", "x:o:AQ", "a:o:AQ:extra", "evp:1:2"])
+def test_unpack_rejects_unknown_format(data):
+    assert appt._unpack_cb(data) is None
+
+
+def test_unpack_broken_payload_has_no_id():
+    assert appt._unpack_cb("a:o:") == ("ok", None)
+    assert appt._unpack_cb("a:o:!!") == ("ok", None)
@@ -12,3 +12,24 @@ def test_start_help_flow(fctx):
     ev.help_command(upd, fctx)
     # Принимаем оба текста помощи: с заголовком "Справка" или без него.
     assert any(needle in upd.message.last_reply for needle in ("Справка", "Календарь-бот"))
+
+
+def test_split_message_short_text_is_one_part():
+    assert ev._split_message("привет") == ["привет"]
+
+
+def test_split_message_splits_on_line_boundaries():
+    lines = [f"{i:02d} " + "x" * 6 for i in range(10)]   # строки по 9 символов
+    text = "\n".join(lines)
+    parts = ev._split_message(text, limit=30)
+
+    assert all(len(p) <= 30 for p in parts)
+    assert "\n".join(parts) == text
+    assert all(p.split("\n")[0] in lines for p in parts)   # строки не рвутся
+
+
+def test_split_message_cuts_overlong_line():
+    text = "head\n" + "y" * 25 + "\ntail"
+    parts = ev._split_message(text, limit=10)
+
+    assert parts == ["head", "y" * 10, "y" * 10, "y" * 5 + "\ntail"]
@@ -6,7 +6,7 @@ tgapp
 
 Содержит:
 - core.py — общие сервисы и утилиты (логгер, трекинг, вспомогательные функции);
-- fsm.py — простая in-memory FSM для управления диалогами;
+- fsm.py — простая FSM для управления диалогами (память процесса или Redis);
 - handlers_events.py — обработчики команд и FSM по событиям (создание, редактирование, удаление);
 - handlers_appointments.py — FSM-диалоги и callback-обработка встреч (приглашения, подтверждения).
 
@@ -9,12 +9,20 @@ tgapp/core.py
 """
 
 from __future__ import annotations
-from typing import Optional
+from typing import Callable, Deque, Dict, Iterator, Optional, Tuple
 
+import functools
 import logging
 import os
 import sys
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+
+from cachetools import TTLCache
 from django.db.models import F
 from telegram import Update
 
@@ -31,13 +39,15 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "webapp.settings")
 django.setup()
 
 # Теперь можно импортировать Django-модели
-from django.db import transaction  # noqa: E402
+from django.db import close_old_connections, transaction  # noqa: E402
 from calendarapp.models import BotStatistics, TgUser  # noqa: E402
 
 from telegram import BotCommand, ReplyKeyboardMarkup, ReplyKeyboardRemove  # noqa: E402
+from telegram.ext import Filters  # noqa: E402
 
 # БД-обёртки проекта
 from db import (  # noqa: E402
+    borrow_connection,
     get_connection,
     Calendar,
     register_user,
@@ -62,14 +72,65 @@ def get_calendar() -> Calendar:
     return Calendar(get_connection())
 
 
+@contextmanager
+def calendar_session() -> Iterator[Calendar]:
+    """Calendar на соединении из пула; соединение возвращается в пул по выходу из with."""
+    with borrow_connection() as conn:
+        yield Calendar(conn)
+
+
+# --- Разбор ID из текста пользователя ---
+
+def parse_id(text: str) -> Optional[int]:
+    """
+    Разобрать неотрицательный ID (события, Telegram-пользователя) из строки.
+
+    Принимаются только ASCII-цифры: int() сам по себе пропустил бы знак,
+    пробелы по краям, «1_000» и цифры других алфавитов. Проверка и разбор —
+    без try/except.
+
+    :param text: строка (пробелы по краям допускаются)
+    :return: число или None, если строка не является ID
+    """
+    text = text.strip()
+    return int(text) if text.isascii() and text.isdigit() else None
+
+
 # --- Общая клавиатура «Отмена» для диалогов ---
 CANCEL_KB = ReplyKeyboardMarkup([["Отмена"]], resize_keyboard=True, one_time_keyboard=True)
 
+# Частые написания «Отмена» (кнопка клавиатуры и ручной ввод) — без вызова lower()
+CANCEL_WORDS = frozenset({"отмена", "Отмена", "ОТМЕНА"})
+
+
+def is_cancel_text(msg: str) -> bool:
+    """
+    Является ли текст командой отмены диалога (без учёта регистра).
+    lower() вызывается только для строк длины слова «отмена».
+    """
+    return msg in CANCEL_WORDS or (len(msg) == 6 and msg.lower() == "отмена")
+
+
+# Профили TgUser, уже сверенные с БД: tg_id -> (username, first_name, last_name).
+# Пока данные пользователя в Telegram не менялись, повторные сообщения не
+# обращаются к БД; через час запись устаревает и профиль сверяется снова.
+_PROFILES: TTLCache = TTLCache(maxsize=100_000, ttl=3600)
+_PROFILES_LOCK = threading.Lock()
+
 
 def ensure_profile_from_update(update: Update) -> None:
-    """Гарантирует существование профиля TgUser на основе Telegram-пользователя."""
+    """
+    Гарантирует существование профиля TgUser на основе Telegram-пользователя.
+    Обращается к БД только для новых (или изменившихся) профилей, см. _PROFILES.
+    """
     u = update.effective_user
-    ensure_tg_user(u.id, u.username, u.first_name, u.last_name)
+    profile = (u.username, u.first_name, u.last_name)
+    with _PROFILES_LOCK:
+        if _PROFILES.get(u.id) == profile:
+            return
+    ensure_tg_user(u.id, *profile)
+    with _PROFILES_LOCK:
+        _PROFILES[u.id] = profile
 
 # ========== Статистика (BotStatistics) ==========
 
@@ -170,6 +231,85 @@ def track_user_event_cancelled(tg_id: int) -> None:
     TgUser.objects.filter(tg_id=tg_id).update(events_cancelled=F("events_cancelled") + 1)
 
 
+# --- Write-behind статистики ---
+# Счётчики не влияют на ответ пользователю, поэтому хендлеры только копят
+# приращения в памяти, а фоновый поток раз в STATS_FLUSH_INTERVAL секунд
+# записывает их одной транзакцией: один UPDATE суточной строки с F()-выражениями
+# по всем полям и по одному UPDATE на каждого затронутого пользователя.
+STATS_FLUSH_INTERVAL = float(os.getenv("STATS_FLUSH_INTERVAL", "2"))
+
+# action -> (поле BotStatistics, поле TgUser)
+_EVENT_ACTION_FIELDS: Dict[str, Tuple[str, str]] = {
+    "created": ("event_count", "events_created"),
+    "edited": ("edited_events", "events_edited"),
+    "cancelled": ("cancelled_events", "events_cancelled"),
+}
+
+_PENDING_TOTALS: Counter = Counter()
+_PENDING_USERS: Dict[int, Counter] = {}
+_PENDING_LOCK = threading.Lock()
+_FLUSHER: Optional[threading.Thread] = None
+
+
+def _flush_loop() -> None:
+    while True:
+        time.sleep(STATS_FLUSH_INTERVAL)
+        flush_stats()
+
+
+def _ensure_flusher() -> None:
+    global _FLUSHER
+    if _FLUSHER is None:
+        with _PENDING_LOCK:
+            if _FLUSHER is None:
+                _FLUSHER = threading.Thread(target=_flush_loop, name="stats-flush", daemon=True)
+                _FLUSHER.start()
+
+
+def record_event_action(action: str, tg_id: int) -> None:
+    """
+    Учесть действие с событием (суточная статистика + счётчик пользователя).
+    Запись в БД происходит в фоне, см. flush_stats.
+
+    :param action: "created" | "edited" | "cancelled"
+    :param tg_id: Telegram ID пользователя
+    """
+    total_field, user_field = _EVENT_ACTION_FIELDS[action]
+    with _PENDING_LOCK:
+        _PENDING_TOTALS[total_field] += 1
+        _PENDING_USERS.setdefault(tg_id, Counter())[user_field] += 1
+    _ensure_flusher()
+
+
+def flush_stats() -> None:
+    """
+    Записать накопленные приращения счётчиков в БД.
+    Вызывается фоновым потоком и при остановке бота.
+    """
+    global _PENDING_TOTALS, _PENDING_USERS
+    with _PENDING_LOCK:
+        totals, users = _PENDING_TOTALS, _PENDING_USERS
+        _PENDING_TOTALS, _PENDING_USERS = Counter(), {}
+    if not totals:
+        return
+
+    # Поток долгоживущий: отбрасываем соединение, если БД его закрыла
+    close_old_connections()
+    try:
+        with transaction.atomic():
+            stat = _get_today_stat_row()
+            BotStatistics.objects.filter(pk=stat.pk).update(
+                **{field: F(field) + n for field, n in totals.items()}
+            )
+            for tg_id, counts in users.items():
+                TgUser.objects.filter(tg_id=tg_id).update(
+                    **{field: F(field) + n for field, n in counts.items()}
+                )
+        logger.info("STAT: записано %s (пользователей: %d)", dict(totals), len(users))
+    except Exception:
+        logger.exception("STAT: не удалось записать счётчики %s", dict(totals))
+
+
 # ========== Общие утилиты ==========
 
 def setup_bot_commands(bot) -> None:
@@ -199,25 +339,187 @@ def setup_bot_commands(bot) -> None:
     logger.info("TG меню команд установлено (%d шт.)", len(commands))
 
 
+# --- Очереди FSM-обработчиков по пользователям ---
+# У каждого пользователя с необработанными апдейтами — своя FIFO-очередь;
+# её разбирает общий пул из FSM_WORKERS потоков по одной задаче за раз.
+# Шаги диалога одного пользователя идут строго по порядку, а медленный шаг
+# одного пользователя занимает один поток и не задерживает остальных.
+# Пустая очередь удаляется сразу — словарь не растёт с числом пользователей.
+# (FSM_SHARDS — прежнее имя настройки, читается для совместимости.)
+FSM_WORKERS = max(1, int(os.getenv("FSM_WORKERS", os.getenv("FSM_SHARDS", "4"))))
+_FSM_POOL = ThreadPoolExecutor(max_workers=FSM_WORKERS, thread_name_prefix="fsm")
+# user_id -> очередь задач; наличие ключа означает, что задача уже запланирована
+_USER_QUEUES: Dict[int, Deque[Callable[[], None]]] = {}
+_USER_QUEUES_LOCK = threading.Lock()
+
+
+def _run_next(key: int) -> None:
+    """Выполнить очередную задачу пользователя и запланировать следующую."""
+    with _USER_QUEUES_LOCK:
+        task = _USER_QUEUES[key].popleft()
+    try:
+        task()
+    finally:
+        with _USER_QUEUES_LOCK:
+            if not _USER_QUEUES[key]:
+                del _USER_QUEUES[key]
+                return
+        # Следующая задача — снова в общую очередь пула: поток не закрепляется
+        # за одним «болтливым» пользователем
+        _FSM_POOL.submit(_run_next, key)
+
+
+def _submit_serial(key: int, task: Callable[[], None]) -> None:
+    """Поставить задачу в очередь пользователя key (FIFO)."""
+    with _USER_QUEUES_LOCK:
+        queue = _USER_QUEUES.get(key)
+        scheduled = queue is not None
+        if not scheduled:
+            queue = _USER_QUEUES[key] = deque()
+        queue.append(task)
+    if not scheduled:
+        _FSM_POOL.submit(_run_next, key)
+
+
+def with_fresh_db(handler: Callable[[Update, object], None]) -> Callable[[Update, object], None]:
+    """
+    Обернуть хендлер, выполняемый в потоке пула, проверкой Django-соединения.
+
+    CONN_MAX_AGE / CONN_HEALTH_CHECKS работают только через
+    close_old_connections(), а его Django вызывает лишь на границах
+    HTTP-запроса. В потоках бота это делаем перед каждым апдейтом сами:
+    устаревшее или закрытое БД соединение потока отбрасывается, а первое
+    обращение к ORM проверяет живость переиспользуемого.
+
+    :param handler: хендлер вида (update, context) -> None
+    :return: хендлер для run_async
+    """
+    @functools.wraps(handler)
+    def wrapper(update: Update, context) -> None:
+        close_old_connections()
+        handler(update, context)
+
+    return wrapper
+
+
+def per_user_serial(handler: Callable[[Update, object], None]) -> Callable[[Update, object], None]:
+    """
+    Обернуть хендлер так, чтобы апдейты одного пользователя выполнялись по порядку.
+
+    Обёртка не блокирует Dispatcher: апдейт ставится в очередь пользователя, а
+    исключения передаются в error-хендлеры Dispatcher, как у обычных хендлеров.
+
+    :param handler: хендлер вида (update, context) -> None
+    :return: хендлер для регистрации без run_async
+    """
+    def _run(update: Update, context) -> None:
+        try:
+            close_old_connections()   # см. with_fresh_db
+            handler(update, context)
+        except Exception as exc:
+            # Исключение внутри пула иначе потеряется вместе с Future
+            dispatcher = getattr(context, "dispatcher", None)
+            if dispatcher is not None:
+                dispatcher.dispatch_error(update, exc)
+            else:
+                logger.exception("Ошибка в %s", handler.__name__)
+
+    @functools.wraps(handler)
+    def wrapper(update: Update, context) -> None:
+        user = update.effective_user
+        _submit_serial(user.id if user else 0, functools.partial(_run, update, context))
+
+    return wrapper
+
+
+# ---------------------------------------------------------------------------
+# Маршрутизация команд
+# ---------------------------------------------------------------------------
+
+# Таблица команд: имя (без «/», в нижнем регистре) -> (хендлер, run_async)
+CommandTable = Dict[str, Tuple[Callable[[Update, object], None], bool]]
+
+# Фильтр для command_router. MessageHandler сам по себе принимает и посты
+# каналов (channel_post, edited_channel_post), где нет update.message и
+# effective_user; CommandHandler слушал только сообщения — сохраняем ту же область.
+COMMAND_FILTER = Filters.command & Filters.update.messages
+
+
+def command_router(commands: CommandTable) -> Callable[[Update, object], None]:
+    """
+    Один хендлер на все команды: имя команды ищется в словаре за O(1),
+    вместо того чтобы Dispatcher по очереди проверял каждый CommandHandler.
+
+    Как и CommandHandler, заполняет context.args и игнорирует команды,
+    адресованные другому боту (/cmd@other_bot); неизвестные команды — тоже.
+
+    :param commands: {"имя": (хендлер, run_async)}
+    :return: хендлер для MessageHandler(COMMAND_FILTER, ...)
+    """
+    # Хендлеры для пула воркеров оборачиваем один раз, а не на каждый апдейт
+    commands = {
+        name: (with_fresh_db(handler) if run_async else handler, run_async)
+        for name, (handler, run_async) in commands.items()
+    }
+
+    def route(update: Update, context) -> None:
+        head, *args = (update.effective_message.text or "").split()
+        name, _, target = head[1:].partition("@")
+        if target and target.lower() != (context.bot.username or "").lower():
+            return
+        entry = commands.get(name.lower())
+        if entry is None:
+            return
+        handler, run_async = entry
+        context.args = args
+        if run_async:
+            context.dispatcher.run_async(handler, update, context, update=update)
+        else:
+            handler(update, context)
+
+    return route
+
+
+# TG ID пользователей, чья регистрация в users уже подтверждена (TTL LRU).
+# Кэшируются только положительные ответы; через час запись устаревает,
+# и следующая команда снова сверится с БД.
+_REGISTERED: TTLCache = TTLCache(maxsize=100_000, ttl=3600)
+_REGISTERED_LOCK = threading.Lock()
+
+
+def _mark_registered(user_id: int) -> None:
+    """Запомнить (или продлить) факт регистрации пользователя."""
+    with _REGISTERED_LOCK:
+        _REGISTERED[user_id] = True
+
+
+def _is_registered_cached(user_id: int) -> bool:
+    """Есть ли свежая запись о регистрации пользователя в кэше."""
+    with _REGISTERED_LOCK:
+        return _REGISTERED.get(user_id, False)
+
 
 def ensure_registered(update, *, user_id: int, username: str, first_name: str) -> bool:
     """
     Проверить регистрацию пользователя, при необходимости — подсказать /register.
     Возвращает True, если пользователь зарегистрирован.
+
+    Положительный ответ кэшируется в процессе (_REGISTERED, TTL 1 час): повторные
+    команды уже зарегистрированного пользователя не обращаются к БД.
     """
-    conn = None
+    if _is_registered_cached(user_id):
+        return True
+
     try:
-        conn = get_connection()
-        exists = user_exists(conn, user_id)
+        with borrow_connection() as conn:
+            exists = user_exists(conn, user_id)
     except Exception:
         logger.exception("Ошибка доступа к базе при проверке регистрации.")
         update.message.reply_text("Ошибка доступа к базе при проверке регистрации.")
         return False
-    finally:
-        if conn:
-            conn.close()
 
     if exists:
+        _mark_registered(user_id)
         return True
 
     update.message.reply_text("Сначала выполните регистрацию: /register")
@@ -226,32 +528,39 @@ def ensure_registered(update, *, user_id: int, username: str, first_name: str) -
 
 def register_in_db_and_track(update, *, user_id: int, username: str, first_name: str) -> None:
     """Регистрация пользователя + учёт статистики «новый пользователь»."""
-    conn = None
     try:
-        conn = get_connection()
-        already_exists = user_exists(conn, user_id)
-        register_user(conn, user_id, username or "", first_name or "")
+        with borrow_connection() as conn:
+            already_exists = user_exists(conn, user_id)
+            register_user(conn, user_id, username or "", first_name or "")
+        _mark_registered(user_id)
         update.message.reply_text("Регистрация выполнена. Можно создавать события.")
         track_new_user(tg_user_id=user_id, is_new=not already_exists)
     except Exception:
         logger.exception("Ошибка при регистрации пользователя %s", user_id)
         update.message.reply_text("Произошла ошибка при регистрации.")
-    finally:
-        if conn:
-            conn.close()
 
 
 # Удобный алиас, чтобы из хендлеров импортировать одним местом
 __all__ = [
     "logger",
     "get_calendar",         # <-- Изменилось
+    "calendar_session",
     "get_connection",       # <-- Добавилось
     "CANCEL_KB",
+    "is_cancel_text",
+    "parse_id",
     "setup_bot_commands",
     "ensure_registered",
     "register_in_db_and_track",
     "track_event_created",
     "track_event_edited",
     "track_event_cancelled",
+    "record_event_action",
+    "flush_stats",
     "ensure_profile_from_update",
+    "with_fresh_db",
+    "per_user_serial",
+    "CommandTable",
+    "COMMAND_FILTER",
+    "command_router",
 ]
\ No newline at end of file
@@ -4,25 +4,46 @@ tgapp.fsm
 
 Небольшой слой FSM (finite state machine) для бота.
 
-Хранит состояние пользователя в памяти процесса:
+Хранит состояние пользователя в подключаемом хранилище:
     user_id -> {"flow": <str|None>, "step": <str|None>, "data": <dict>}
 
+Хранилища:
+- MemoryStorage — словарь в памяти процесса (по умолчанию);
+- RedisStorage  — Redis, если задана переменная окружения FSM_REDIS_URL
+  (например, redis://redis:6379/0). Состояние переживает рестарт бота;
+- CachedStorage — кэш в памяти процесса поверх Redis (по умолчанию при
+  FSM_REDIS_URL): шаги диалога читают состояние без обращения к Redis,
+  запись уходит в Redis в фоне. Если с одним Redis работают несколько
+  экземпляров бота одновременно, кэш отключают: FSM_LOCAL_CACHE=0.
+
 Особенности:
 - Без зависимостей от telegram/django.
 - Потоки (flow) и шаги (step) — произвольные строки (например, "CREATE", "EDIT").
-- Данные (data) — произвольный словарь с промежуточными значениями.
+- Данные (data) — произвольный словарь с промежуточными значениями
+  (для Redis — JSON-сериализуемый; даты/время сохраняются строками).
 - Предоставляет функции для чтения/записи состояния и простые парсеры даты/времени.
 
 Важно:
-- Все данные живут в памяти процесса. При рестарте бота состояние теряется.
+- С MemoryStorage при рестарте бота состояние теряется.
 - Типы возвращаемых значений у парсеров (str|None) согласованы с текущими хендлерами.
 """
 
 from __future__ import annotations
 
-from datetime import datetime
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from functools import lru_cache
 from typing import Any, Dict, Final, Optional, TypedDict
 
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
 
 class FSMState(TypedDict, total=False):
     """Структура FSM-состояния одного пользователя."""
@@ -36,13 +57,167 @@ STATE_SHARE_WAIT_EVENT_ID = "SHARE_WAIT_EVENT_ID"
 STATE_SHARE_WAIT_VISIBILITY = "STATE_SHARE_WAIT_VISIBILITY"
 
 
-# Хранилище состояний для всех пользователей (in-memory).
-_USER_STATES: Dict[int, FSMState] = {}
-
 # Состояние по умолчанию (когда записей нет).
 _DEFAULT_STATE: Final[FSMState] = {"flow": None, "step": None, "data": {}}
 
 
+# ---------------------------------------------------------------------------
+# Хранилища состояний
+# ---------------------------------------------------------------------------
+
+class MemoryStorage:
+    """Состояния в словаре процесса: быстро, но теряются при рестарте."""
+
+    def __init__(self) -> None:
+        self._states: Dict[int, FSMState] = {}
+
+    def get(self, user_id: int) -> Optional[FSMState]:
+        """Вернуть состояние пользователя или None."""
+        return self._states.get(user_id)
+
+    def set(self, user_id: int, state: FSMState) -> None:
+        """Сохранить состояние пользователя."""
+        self._states[user_id] = state
+
+    def delete(self, user_id: int) -> None:
+        """Удалить состояние пользователя (если есть)."""
+        self._states.pop(user_id, None)
+
+
+class RedisStorage:
+    """
+    Состояния в Redis: ключ "<prefix>:<user_id>" со строкой JSON и TTL.
+
+    Незавершённый диалог живёт ttl секунд с момента последнего сообщения:
+    чтение продлевает TTL в том же запросе (GET + EXPIRE одним pipeline),
+    поэтому сообщение, не меняющее шаг, стоит одного обращения к Redis.
+    """
+
+    def __init__(self, url: str, prefix: str = "fsm", ttl: int = 1800, max_connections: int = 32) -> None:
+        import redis  # опциональная зависимость: нужна только при FSM_REDIS_URL
+
+        # Пул общий для всех потоков бота: воркеры Dispatcher, потоки FSM и
+        # поток записи CachedStorage; при нехватке redis-py бросает ConnectionError
+        self._redis = redis.Redis.from_url(url, decode_responses=True, max_connections=max_connections)
+        self._prefix = prefix
+        self._ttl = ttl
+
+    def _key(self, user_id: int) -> str:
+        return f"{self._prefix}:{user_id}"
+
+    def get(self, user_id: int) -> Optional[FSMState]:
+        """Вернуть состояние пользователя или None."""
+        key = self._key(user_id)
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.expire(key, self._ttl)
+        raw, _ = pipe.execute()
+        return json.loads(raw) if raw else None
+
+    def set(self, user_id: int, state: FSMState) -> None:
+        """Сохранить состояние пользователя (с продлением TTL)."""
+        self._redis.set(self._key(user_id), json.dumps(state, default=str), ex=self._ttl)
+
+    def delete(self, user_id: int) -> None:
+        """Удалить состояние пользователя (если есть)."""
+        self._redis.delete(self._key(user_id))
+
+    def touch(self, user_id: int) -> None:
+        """Продлить TTL состояния без чтения (для чтений из кэша CachedStorage)."""
+        self._redis.expire(self._key(user_id), self._ttl)
+
+
+# Отметка «состояния нет» в CachedStorage (чтобы не ходить в Redis за пустотой).
+_ABSENT: Final = object()
+
+
+class CachedStorage:
+    """
+    Кэш состояний в памяти процесса поверх постоянного хранилища (Redis).
+
+    Чтение — из кэша; при промахе состояние (или его отсутствие) читается из
+    backend и запоминается. Запись и удаление сразу видны в кэше, а в backend
+    уходят в фоне единственным потоком — по порядку вызовов. Наружу отдаются
+    копии: правка state["data"] в хендлере без set_state не меняет кэш.
+
+    Чтение из кэша не обращается к backend синхронно, но скользящий TTL
+    сохраняется: если у backend есть touch(), продление ставится в тот же
+    фоновый поток записи (после уже поставленных set/delete).
+
+    Кэш корректен, пока состояния пишет один процесс бота (polling).
+    """
+
+    def __init__(self, backend, ttl: int, maxsize: int = 100_000) -> None:
+        self._backend = backend
+        self._touch = getattr(backend, "touch", None)
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-persist")
+
+    @staticmethod
+    def _copy(state: FSMState) -> FSMState:
+        return {**state, "data": dict(state.get("data") or {})}
+
+    def _persist(self, fn, *args: Any) -> None:
+        try:
+            fn(*args)
+        except Exception:
+            logger.exception("FSM: не удалось сохранить состояние в хранилище")
+
+    def get(self, user_id: int) -> Optional[FSMState]:
+        """Вернуть состояние пользователя или None."""
+        with self._lock:
+            state = self._cache.get(user_id)
+        if state is None:
+            loaded = self._backend.get(user_id)
+            with self._lock:
+                # Пока читали backend, set()/delete() мог уже записать свежее
+                # значение — его не перетираем прочитанным
+                state = self._cache.get(user_id)
+                if state is None:
+                    state = loaded if loaded is not None else _ABSENT
+                    self._cache[user_id] = state
+        elif state is not _ABSENT and self._touch is not None:
+            self._writer.submit(self._persist, self._touch, user_id)
+        return None if state is _ABSENT else self._copy(state)
+
+    def set(self, user_id: int, state: FSMState) -> None:
+        """Сохранить состояние: сразу в кэш, в backend — в фоне."""
+        state = self._copy(state)
+        with self._lock:
+            self._cache[user_id] = state
+        self._writer.submit(self._persist, self._backend.set, user_id, state)
+
+    def delete(self, user_id: int) -> None:
+        """Удалить состояние: сразу в кэше, в backend — в фоне."""
+        with self._lock:
+            self._cache[user_id] = _ABSENT
+        self._writer.submit(self._persist, self._backend.delete, user_id)
+
+
+def _make_storage():
+    """
+    Выбрать хранилище по окружению: Redis при FSM_REDIS_URL (с кэшем в памяти,
+    если не FSM_LOCAL_CACHE=0), иначе память процесса.
+    """
+    url = os.getenv("FSM_REDIS_URL")
+    if url:
+        ttl = int(os.getenv("FSM_STATE_TTL", "1800"))
+        storage = RedisStorage(
+            url,
+            ttl=ttl,
+            max_connections=int(os.getenv("FSM_REDIS_MAX_CONNECTIONS", "32")),
+        )
+        if os.getenv("FSM_LOCAL_CACHE", "1") != "0":
+            return CachedStorage(storage, ttl=ttl)
+        return storage
+    return MemoryStorage()
+
+
+# Хранилище состояний для всех пользователей.
+_STORAGE = _make_storage()
+
+
 # ---------------------------------------------------------------------------
 # Базовые операции со состоянием
 # ---------------------------------------------------------------------------
@@ -56,11 +231,11 @@ def set_state(user_id: int, flow: Optional[str], step: Optional[str], data: Opti
     :param step: имя шага (например, "WAIT_NAME") или None
     :param data: словарь с произвольными данными (может быть None)
     """
-    _USER_STATES[user_id] = {
+    _STORAGE.set(user_id, {
         "flow": flow,
         "step": step,
         "data": data or {},
-    }
+    })
 
 
 def get_state(user_id: int) -> FSMState:
@@ -70,7 +245,8 @@ def get_state(user_id: int) -> FSMState:
     :param user_id: Telegram user_id
     :return: словарь состояния {'flow': ..., 'step': ..., 'data': {...}}
     """
-    return _USER_STATES.get(user_id, _DEFAULT_STATE.copy())
+    state = _STORAGE.get(user_id)
+    return state if state is not None else {**_DEFAULT_STATE, "data": {}}
 
 
 def clear_state(user_id: int) -> None:
@@ -79,7 +255,7 @@ def clear_state(user_id: int) -> None:
 
     :param user_id: Telegram user_id
     """
-    _USER_STATES.pop(user_id, None)
+    _STORAGE.delete(user_id)
 
 
 def update_state_data(user_id: int, **kwargs: Any) -> None:
@@ -89,11 +265,11 @@ def update_state_data(user_id: int, **kwargs: Any) -> None:
     :param user_id: Telegram user_id
     :param kwargs: пары ключ-значение, которые нужно добавить/обновить
     """
-    state = _USER_STATES.setdefault(user_id, _DEFAULT_STATE.copy())
+    state = _STORAGE.get(user_id) or {**_DEFAULT_STATE, "data": {}}
     data = state.get("data") or {}
     data.update(kwargs)
     state["data"] = data
-    _USER_STATES[user_id] = state
+    _STORAGE.set(user_id, state)
 
 
 def is_in_flow(user_id: int, flow: str) -> bool:
@@ -111,6 +287,16 @@ def is_in_flow(user_id: int, flow: str) -> bool:
 # Парсеры ввода пользователя
 # ---------------------------------------------------------------------------
 
+# Шаблоны компилируются один раз при импорте. Допускают те же записи,
+# что и strptime("%Y-%m-%d") / strptime("%H:%M"): месяц, день, часы и минуты
+# могут быть из одной цифры.
+_DATE_RE: Final = re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})", re.ASCII)
+_TIME_RE: Final = re.compile(r"(\d{1,2}):(\d{1,2})", re.ASCII)
+
+# Парсеры — чистые функции, а пользователи чаще всего вводят одни и те же
+# значения ("2025-12-31", "09:00"): результаты кэшируются (LRU, до 1024 строк).
+
+@lru_cache(maxsize=1024)
 def parse_date(text: str) -> Optional[str]:
     """
     Проверить, что дата в формате YYYY-MM-DD (строка).
@@ -120,13 +306,17 @@ def parse_date(text: str) -> Optional[str]:
     :return: "YYYY-MM-DD" либо None
     """
     s = (text or "").strip()
+    m = _DATE_RE.fullmatch(s)
+    if not m:
+        return None
     try:
-        datetime.strptime(s, "%Y-%m-%d")
-        return s
+        date(int(m[1]), int(m[2]), int(m[3]))
     except ValueError:
         return None
+    return s
 
 
+@lru_cache(maxsize=1024)
 def parse_time(text: str) -> Optional[str]:
     """
     Проверить, что время в формате HH:MM (24-часовой формат).
@@ -136,15 +326,17 @@ def parse_time(text: str) -> Optional[str]:
     :return: "HH:MM" либо None
     """
     s = (text or "").strip()
-    try:
-        datetime.strptime(s, "%H:%M")
-        return s
-    except ValueError:
+    m = _TIME_RE.fullmatch(s)
+    if not m or int(m[1]) > 23 or int(m[2]) > 59:
         return None
+    return s
 
 
 __all__ = [
     "FSMState",
+    "MemoryStorage",
+    "RedisStorage",
+    "CachedStorage",
     "set_state",
     "get_state",
     "clear_state",
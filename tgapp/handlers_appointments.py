@@ -17,37 +17,146 @@ FSM-приглашения на встречу:
 
 from __future__ import annotations
 
-from typing import Any, Optional, Tuple
-
+import base64
+import string
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from cachetools import LRUCache, TTLCache
+from django.utils import timezone
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardRemove
 
 from tgapp.core import (
     logger,
     ensure_registered,
     CANCEL_KB,
-    get_connection,  # <-- Изменилось: импортируем функцию, а не CONN
+    is_cancel_text,
+    parse_id,
 )
 from tgapp.fsm import get_state, set_state, clear_state
 from calendarapp.models import Appointment
 from calendarapp.utils import create_pending_invite_for_event
-from db import get_event_by_id
+from db import borrow_connection, get_event_by_id
+
+
+# Служебное слово «пропустить». Частые написания сверяются с набором «как есть»;
+# остальные — через lower(), но только для строк длины этого слова
+# (по образцу tgapp.core.is_cancel_text).
+_SKIP_WORDS = frozenset({"пропустить", "Пропустить", "ПРОПУСТИТЬ"})
+
+# Компактные коды действий в callback_data → действие обработчика.
+_CB_ACTIONS = {"o": "ok", "n": "no"}
+
+# Token bucket на входящие сообщения диалога INVITE: 5 сообщений/сек, всплеск до 10.
+# Корзина за _RATE_BURST / _RATE_PER_SEC секунд наполняется целиком, поэтому
+# запись, не обновлявшаяся минуту, равна полной корзине и может быть вытеснена.
+_RATE_PER_SEC = 5.0
+_RATE_BURST = 10.0
+_BUCKETS: TTLCache = TTLCache(maxsize=100_000, ttl=60)   # user_id -> (токены, время последнего пополнения)
+_BUCKETS_LOCK = threading.Lock()
+
+# Встречи в финальном статусе (решение уже принято): appt_id -> (participant_tg_id, status).
+# Поздние и повторные нажатия кнопок отвечаются из кэша без запроса к БД.
+_TERMINAL: LRUCache = LRUCache(maxsize=4096)
+_TERMINAL_LOCK = threading.Lock()
+
+# Текст приглашения: постоянная часть разбирается один раз при импорте,
+# на каждое приглашение подставляются только поля события.
+_INVITE_TPL = string.Template(
+    "Вас пригласили на встречу:\n\n"
+    "• Дата/время: $date $time\n"
+    "• Тема: $name\n"
+    "• Комментарий: $details\n\n"
+    "Вы можете подтвердить или отклонить приглашение:"
+)
+
+
+class _EventRef(NamedTuple):
+    """Поля события (из FSM-данных), нужные create_pending_invite_for_event."""
+    id: int
+    date: Any
+    time: Any
+    details: str
 
 
 # ------------------------------
 # Вспомогательные функции
 # ------------------------------
 
-def _safe_int(text: str) -> Optional[int]:
+def _is_skip_text(msg: str) -> bool:
+    """Является ли текст словом «пропустить» (без учёта регистра)."""
+    return msg in _SKIP_WORDS or (len(msg) == 10 and msg.lower() == "пропустить")
+
+
+def _allow(user_id: int, sent_at: Optional[float] = None) -> bool:
     """
-    Аккуратно преобразовать строку в int.
+    Проверить лимит сообщений пользователя (token bucket) и списать один токен.
 
-    :param text: входная строка
-    :return: целое число или None, если не число/пусто
+    Корзина пополняется по времени отправки сообщения, а не по времени его
+    обработки: сообщения одного пользователя выполняются по очереди
+    (per_user_serial), и накопившиеся за медленным шагом сообщения, пришедшие
+    в допустимом темпе, не должны отбрасываться пачкой.
+
+    :param user_id: Telegram user_id
+    :param sent_at: время отправки сообщения (unix-время); None — текущее
+    :return: True — сообщение можно обрабатывать, False — отбросить (флуд)
     """
-    try:
-        return int(text.strip())
-    except Exception:
+    now = time.time() if sent_at is None else sent_at
+    with _BUCKETS_LOCK:
+        tokens, last = _BUCKETS.get(user_id, (_RATE_BURST, now))
+        tokens = min(_RATE_BURST, tokens + max(0.0, now - last) * _RATE_PER_SEC)
+        if tokens < 1.0:
+            _BUCKETS[user_id] = (tokens, now)
+            return False
+        _BUCKETS[user_id] = (tokens - 1.0, now)
+        return True
+
+
+def _pack_cb(action: str, appt_id: int) -> str:
+    """
+    Упаковать callback_data кнопки приглашения в компактный вид «a:<o|n>:<id>».
+
+    ID встречи кодируется big-endian байтами в urlsafe-base64 без паддинга,
+    поэтому строка занимает единицы байт вместо «appt:ok:<число>».
+
+    :param action: "o" — подтвердить, "n" — отклонить
+    :param appt_id: ID встречи (Appointment.pk)
+    :return: строка для InlineKeyboardButton.callback_data
+    """
+    raw = appt_id.to_bytes((appt_id.bit_length() + 7) // 8 or 1, "big")
+    return f"a:{action}:{base64.urlsafe_b64encode(raw).rstrip(b'=').decode()}"
+
+
+def _unpack_cb(data: str) -> Optional[Tuple[str, Optional[int]]]:
+    """
+    Разобрать callback_data кнопки приглашения.
+
+    Понимает компактный формат «a:o|n:<b64id>» и старый «appt:ok|no:<id>»
+    (кнопки в уже отправленных сообщениях продолжают работать).
+
+    :param data: callback_data из CallbackQuery
+    :return: ("ok"|"no", appt_id или None) либо None, если формат не распознан
+    """
+    parts = data.split(":")
+    if len(parts) != 3:
         return None
+    prefix, action, payload = parts
+
+    if prefix == "a":
+        action = _CB_ACTIONS.get(action)
+        if action is None:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))
+        except ValueError:
+            return action, None
+        return action, int.from_bytes(raw, "big") if raw else None
+
+    if prefix == "appt":
+        return action, parse_id(payload)
+
+    return None
 
 
 def _send_invite_message(
@@ -63,25 +172,29 @@ def _send_invite_message(
 
     Возвращает (успех, сообщение_ошибки_или_пусто).
     """
-    text = (
-        "Вас пригласили на встречу:\n\n"
-        f"• Дата/время: {ev['date']} {ev['time']}\n"
-        f"• Тема: {ev['name']}\n"
-        f"• Комментарий: {extra_details or (ev.get('details') or '—')}\n\n"
-        "Вы можете подтвердить или отклонить приглашение:"
+    text = _INVITE_TPL.substitute(
+        date=ev["date"],
+        time=ev["time"],
+        name=ev["name"],
+        details=extra_details or (ev.get("details") or "—"),
     )
     buttons = InlineKeyboardMarkup(
         [[
-            InlineKeyboardButton("✅ Подтвердить", callback_data=f"appt:ok:{appt_id}"),
-            InlineKeyboardButton("❌ Отклонить", callback_data=f"appt:no:{appt_id}"),
+            InlineKeyboardButton("✅ Подтвердить", callback_data=_pack_cb("o", appt_id)),
+            InlineKeyboardButton("❌ Отклонить", callback_data=_pack_cb("n", appt_id)),
         ]]
     )
     try:
-        context.bot.send_message(
+        # queued=False: нужен результат доставки, а не Promise из очереди MQBot;
+        # MQBot при неудаче (после повторов) возвращает None, не бросая
+        sent = context.bot.send_message(
             chat_id=participant_tg_id,
             text=text,
             reply_markup=buttons,
+            queued=False,
         )
+        if sent is None:
+            raise RuntimeError("send_message вернул None")
         logger.info(
             "INVITE sent appt_id=%s organizer=%s -> participant=%s",
             appt_id, organizer_tg_id, participant_tg_id
@@ -120,29 +233,37 @@ def invite_start(update: Any, context: Any) -> None:
     )
 
 
-def invite_process(update: Any, context: Any) -> None:
+def invite_process(update: Any, context: Any, state: Optional[Dict[str, Any]] = None) -> None:
     """
     Обработчик текстов в потоке INVITE:
     - WAIT_PARTICIPANT_ID → запрос event_id
     - WAIT_EVENT_ID       → запрос деталей
     - WAIT_DETAILS        → отправка приглашения
+
+    :param state: уже прочитанное состояние (из text_router); если None — читаем сами
     """
     user = update.effective_user
     msg = (update.message.text or "").strip()
-    state = get_state(user.id)
+    if state is None:
+        state = get_state(user.id)
     step = state.get("step")
     data = state.get("data", {})
 
-    # Универсальная отмена
-    if msg.lower() == "отмена":
+    # Универсальная отмена — до лимита: выйти из диалога можно всегда
+    if is_cancel_text(msg):
         clear_state(user.id)
         logger.info("INVITE cancelled by %s at step=%s", user.id, step)
         update.message.reply_text("Ок, отменил.", reply_markup=ReplyKeyboardRemove())
         return
 
+    sent = getattr(update.message, "date", None)
+    if not _allow(user.id, sent.timestamp() if sent else None):
+        logger.warning("INVITE rate-limited user=%s", user.id)
+        return
+
     # Шаг 1: TG ID участника
     if step == "WAIT_PARTICIPANT_ID":
-        participant_tg_id = _safe_int(msg)
+        participant_tg_id = parse_id(msg)
         if participant_tg_id is None or participant_tg_id <= 0:
             update.message.reply_text("TG ID — это положительное число. Попробуйте ещё раз:", reply_markup=CANCEL_KB)
             return
@@ -158,26 +279,18 @@ def invite_process(update: Any, context: Any) -> None:
 
     # Шаг 2: ID события
     if step == "WAIT_EVENT_ID":
-        event_id = _safe_int(msg)
+        event_id = parse_id(msg)
         if event_id is None or event_id <= 0:
             update.message.reply_text("ID события — это положительное число. Попробуйте ещё раз:", reply_markup=CANCEL_KB)
             return
 
-        # ---
-        # Изменение: получаем "ленивое" подключение
-        # ---
-        conn = None
         try:
-            conn = get_connection()
-            ev = get_event_by_id(conn, event_id)
+            with borrow_connection() as conn:
+                ev = get_event_by_id(conn, event_id)
         except Exception as e:
             logger.exception("Ошибка получения события %s", event_id)
             update.message.reply_text(f"Ошибка при поиске события: {e}", reply_markup=CANCEL_KB)
             return
-        finally:
-            if conn:
-                conn.close()
-        # --- Конец изменения ---
 
         if not ev:
             update.message.reply_text("Не нашёл такое событие. Укажите корректный ID:", reply_markup=CANCEL_KB)
@@ -198,19 +311,13 @@ def invite_process(update: Any, context: Any) -> None:
 
     # Шаг 3: детали → отправка
     if step == "WAIT_DETAILS":
-        details = "" if msg.lower() == "пропустить" else msg
+        details = "" if _is_skip_text(msg) else msg
         ev = data["event"]
 
-        class _E:
-            id = ev["id"]
-            date = ev["date"]
-            time = ev["time"]
-            details = ev.get("details") or ""
-
         appt, err = create_pending_invite_for_event(
             organizer_tg_id=user.id,
             participant_tg_id=data["participant_tg_id"],
-            event=_E,
+            event=_EventRef(ev["id"], ev["date"], ev["time"], ev.get("details") or ""),
             details=details,
         )
         if err == "busy":
@@ -258,43 +365,63 @@ def appointment_decision_handler(update: Any, context: Any) -> None:
     if not query or not query.data:
         return
 
-    parts = query.data.split(":")
-    if len(parts) != 3 or parts[0] != "appt":
+    decoded = _unpack_cb(query.data)
+    if decoded is None:
         query.answer("Некорректные данные.")
         return
 
-    action, appt_id_s = parts[1], parts[2]
-    appt_id = _safe_int(appt_id_s)
+    action, appt_id = decoded
     if not appt_id:
         query.answer("Некорректный номер встречи.")
         return
 
+    user_id = query.from_user.id
+    with _TERMINAL_LOCK:
+        terminal = _TERMINAL.get(appt_id)
+    if terminal is not None and terminal[0] == user_id:
+        query.answer(f"Текущий статус: {Appointment.Status(terminal[1]).label}.")
+        return
+
     try:
-        appt = Appointment.objects.get(pk=appt_id)
+        appt = Appointment.objects.only(
+            "id", "organizer_tg_id", "participant_tg_id", "status", "date", "time",
+        ).get(pk=appt_id)
     except Appointment.DoesNotExist:
         query.answer("Встреча не найдена.")
         return
 
-    user_id = query.from_user.id
     if user_id != appt.participant_tg_id:
         query.answer("Подтверждать или отклонять может только участник этой встречи.")
         return
 
     if appt.status != Appointment.Status.PENDING:
+        with _TERMINAL_LOCK:
+            _TERMINAL[appt.id] = (appt.participant_tg_id, appt.status)
         query.answer(f"Текущий статус: {appt.get_status_display()}.")
         return
 
     if action == "ok":
-        appt.status = Appointment.Status.CONFIRMED
+        new_status = Appointment.Status.CONFIRMED
         human_text = "Встреча подтверждена ✅"
         notify = f"Участник {appt.participant_tg_id} подтвердил встречу #{appt.id} на {appt.date} {appt.time}."
     else:
-        appt.status = Appointment.Status.CANCELLED
+        new_status = Appointment.Status.CANCELLED
         human_text = "Встреча отклонена ❌"
         notify = f"Участник {appt.participant_tg_id} отклонил встречу #{appt.id}."
 
-    appt.save(update_fields=["status"])
-    logger.info("APPT %s -> %s by %s", appt.id, appt.status, user_id)
+    # Условная запись: статус меняется, только если встреча всё ещё PENDING.
+    # Повторное/параллельное нажатие кнопки не перезапишет уже принятое решение.
+    updated = Appointment.objects.filter(
+        pk=appt.id,
+        participant_tg_id=user_id,
+        status=Appointment.Status.PENDING,
+    ).update(status=new_status, updated_at=timezone.now())
+    if not updated:
+        query.answer("Решение по этой встрече уже принято.")
+        return
+    with _TERMINAL_LOCK:
+        _TERMINAL[appt.id] = (appt.participant_tg_id, new_status)
+    logger.info("APPT %s -> %s by %s", appt.id, new_status, user_id)
 
     query.edit_message_reply_markup(reply_markup=None)
     query.answer(human_text)
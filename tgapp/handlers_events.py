@@ -17,6 +17,7 @@ tgapp.handlers_events
 - /share_event                 — сделать событие публичным (FSM по ID)
 - /my_public                   — список моих публичных событий
 - /public_of                   — список публичных событий другого TG-пользователя (FSM)
+  (длинные списки — по EVENT_LIST_LIMIT, дальше кнопка «Показать ещё»)
 - /export                      — кнопки-ссылки CSV/JSON на Django-эндпоинт экспорта
 
 FSM-потоки:
@@ -31,9 +32,10 @@ FSM-потоки:
 from __future__ import annotations
 
 import logging
-from typing import Any, Dict, Iterable, List
-from urllib.parse import quote_plus
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+from cachetools import TTLCache
 from django.conf import settings
 from telegram import (
     InlineKeyboardButton,
@@ -41,7 +43,7 @@ from telegram import (
     ReplyKeyboardRemove,
     Update,
 )
-from telegram.ext import CallbackContext, CommandHandler, MessageHandler, Filters
+from telegram.ext import CallbackContext, CallbackQueryHandler, MessageHandler, Filters
 
 
 from calendarapp.models import Event
@@ -51,21 +53,84 @@ from tgapp import handlers_appointments as appt
 from tgapp.fsm import clear_state, get_state, parse_date, parse_time, set_state
 from tgapp.core import (
     logger,                 # общий логгер приложения
-    get_calendar,           # <-- ИЗМЕНЕНИЕ: импортируем "фабрику"
+    calendar_session,       # Calendar на соединении из пула
     CANCEL_KB,              # ReplyKeyboard с «Отмена»
+    is_cancel_text,
+    parse_id,
     ensure_registered,      # проверка/регистрация в users (psycopg2)
     register_in_db_and_track,
-    track_event_created,    # суточная статистика бота
-    track_event_edited,
-    track_event_cancelled,
+    record_event_action,    # статистика (суточная и по пользователю), в фоне
     ensure_tg_user,         # Django-профиль TgUser
     ensure_profile_from_update,
-    track_user_event_created,
-    track_user_event_edited,
-    track_user_event_cancelled,
+    per_user_serial,
+    with_fresh_db,
+    CommandTable,
+    COMMAND_FILTER,
+    command_router,
 )
 
 StateDict = Dict[str, Any]
+
+# Неизменяемые объекты ответа: создаются один раз, переиспользуются во всех хендлерах.
+_REMOVE_KB = ReplyKeyboardRemove()
+# Единая inline-кнопка «Отмена» для FSM
+_INLINE_CANCEL_KB = InlineKeyboardMarkup(
+    [[InlineKeyboardButton("Отмена", callback_data="fsm:cancel")]]
+)
+_CANCELLED = "Операция отменена."
+
+# Справка /start и /help — собирается один раз при импорте.
+_HELP_TEXT = (
+    "Календарь-бот.\n\n"
+    "Регистрация:\n"
+    "• /register — создать учётную запись\n\n"
+    "События:\n"
+    "• /create_event — создать событие (диалог)\n"
+    "• /display_events — показать мои события\n"
+    "• /read_event <id> — показать событие по ID\n"
+    "• /edit_event — изменить описание (диалог) или /edit_event <id> <новое>\n"
+    "• /delete_event — удалить (диалог) или /delete_event <id>\n\n"
+    "Публикация и экспорт:\n"
+    "• /share_event — сделать событие публичным (по ID)\n"
+    "• /my_public — мои публичные события\n"
+    "• /public_of — публичные события другого пользователя\n"
+    "• /export — выгрузка CSV/JSON\n\n"
+    "Встречи:\n"
+    "• /invite — приглашение на встречу (диалог)\n\n"
+    "Профиль и календарь:\n"
+    "• /login — привязать Telegram-аккаунт к системе\n"
+    "• /calendar — показать мой личный календарь\n\n"
+    "• /cancel — отменить текущую операцию"
+)
+
+# Постоянные подсказки FSM-диалогов (по ключу, без повторяющихся литералов в шагах).
+_PROMPTS: Dict[str, str] = {
+    "CREATE_NAME": "Введите название события:",
+    "CREATE_DATE": "Введите дату в формате ГГГГ-ММ-ДД:",
+    "CREATE_DATE_BAD": "Неверный формат даты. Пример: 2025-12-03. Попробуйте ещё раз:",
+    "CREATE_TIME": "Введите время в формате ЧЧ:ММ (например, 14:30):",
+    "CREATE_TIME_BAD": "Неверный формат времени. Пример: 09:05. Попробуйте ещё раз:",
+    "CREATE_DETAILS": "Введите описание события:",
+    "EDIT_ID": "Введите ID события для изменения описания:",
+    "EDIT_DETAILS": "Введите новое описание:",
+    "DELETE_ID": "Введите ID события для удаления:",
+    "BAD_ID": "ID должен быть числом.",
+    "BAD_ID_RETRY": "ID должен быть числом. Введите ID:",
+}
+
+# Подсказки, повтор которых подряд ничего не сообщает пользователю: повторы
+# неверного ввода и отмены. Только их бот схлопывает при быстрых повторах
+# (bot.MQBot); результаты и подтверждения действий отправляются всегда.
+REPEATABLE_REPLIES = frozenset({
+    _CANCELLED,
+    _PROMPTS["BAD_ID"],
+    _PROMPTS["BAD_ID_RETRY"],
+    _PROMPTS["CREATE_DATE_BAD"],
+    _PROMPTS["CREATE_TIME_BAD"],
+})
+
+# Обработчик шага FSM: (update, user, msg, data) -> следующий шаг или None (диалог завершён).
+StepHandler = Callable[[Update, Any, str, Dict[str, Any]], Optional[str]]
 log = logging.getLogger(__name__)
 
 
@@ -73,29 +138,184 @@ log = logging.getLogger(__name__)
 # Вспомогалки (форматирование, inline-отмена)
 # ---------------------------------------------------------------------------
 
-def _format_events_for_message(rows: Iterable[Event]) -> str:
+# Поля события для вывода списком: читаются через values_list, без создания моделей.
+_EVENT_LIST_FIELDS = ("id", "date", "time", "name", "details")
+# Сколько событий показывать в одном сообщении (лимит Telegram — 4096 символов).
+EVENT_LIST_LIMIT = 50
+
+
+def _event_rows(offset: int = 0, **filters: Any) -> List[tuple]:
+    """
+    Кортежи _EVENT_LIST_FIELDS для событий по фильтру, по дате/времени/ID.
+    Читается одна страница — не больше EVENT_LIST_LIMIT + 1 строк начиная
+    с offset: лишняя строка лишь сообщает, что есть следующая страница.
+    """
+    return list(
+        Event.objects.filter(**filters)
+        .order_by("date", "time", "id")
+        .values_list(*_EVENT_LIST_FIELDS)[offset:offset + EVENT_LIST_LIMIT + 1]
+    )
+
+
+def _format_events_for_message(rows: List[tuple], offset: int = 0) -> str:
     """
     Сформировать удобный список событий для пользователя.
     Формат: "[ID 1] 2025-12-12 12:30 — Название\nОписание"
+
+    :param rows: кортежи (id, date, time, name, details), см. _event_rows;
+                 сверх EVENT_LIST_LIMIT строк не выводятся
+    :param offset: номер первой строки страницы (для подписи об обрезке)
     """
-    lines: List[str] = []
-    for ev in rows:
-        details = (ev.details or "").strip()
-        base = f"[ID {ev.id}] {ev.date} {ev.time} — {ev.name}"
-        lines.append(base if not details else f"{base}\n{details}")
+    lines: List[str] = [
+        f"[ID {ev_id}] {ev_date} {ev_time} — {name}\n{body}"
+        if (body := (details or "").strip())
+        else f"[ID {ev_id}] {ev_date} {ev_time} — {name}"
+        for ev_id, ev_date, ev_time, name, details in rows[:EVENT_LIST_LIMIT]
+    ]
+    if len(rows) > EVENT_LIST_LIMIT:
+        lines.append(f"… показаны события {offset + 1}–{offset + EVENT_LIST_LIMIT}.")
     return "\n\n".join(lines)
 
 
-def _inline_cancel_kb() -> InlineKeyboardMarkup:
-    """Единая inline-кнопка «Отмена» для FSM."""
+# Готовые списки событий владельца: (owner_tg_id, только_публичные) -> (текст, число
+# событий); "" — событий нет. Короткий TTL гасит повторные /calendar, /my_public и
+# /public_of; изменения самого владельца (create/share/edit/delete) сбрасывают
+# его записи сразу.
+_EVENTS_TEXT_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=30)
+_EVENTS_TEXT_CACHE_LOCK = threading.Lock()
+
+
+def _events_text(owner_id: int, public_only: bool = False) -> Tuple[str, int]:
+    """Отформатированный список событий владельца и их число (через кэш)."""
+    key = (owner_id, public_only)
+    with _EVENTS_TEXT_CACHE_LOCK:
+        cached = _EVENTS_TEXT_CACHE.get(key)
+    if cached is None:
+        filters = {"user_id": owner_id, "is_public": True} if public_only else {"user_id": owner_id}
+        rows = _event_rows(**filters)
+        cached = (_format_events_for_message(rows), len(rows))
+        with _EVENTS_TEXT_CACHE_LOCK:
+            _EVENTS_TEXT_CACHE[key] = cached
+    return cached
+
+
+# Предельная длина одного сообщения Telegram (символов)
+_TG_MESSAGE_LIMIT = 4096
+
+
+def _split_message(text: str, limit: int = _TG_MESSAGE_LIMIT) -> List[str]:
+    """
+    Разбить текст на части не длиннее limit: по границам строк, а строку
+    длиннее limit (очень длинное описание) — просто по limit символов.
+    """
+    if len(text) <= limit:
+        return [text]
+
+    chunks: List[str] = []
+    current = ""
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks or [text[:limit]]
+
+
+def _reply_long(message: Any, text: str, reply_markup: Any = None) -> None:
+    """
+    Ответить текстом любой длины: несколько сообщений по лимиту Telegram.
+    Части уходят через очередь отправки бота (по порядку, с её ограничением
+    скорости); клавиатура прикрепляется к последней части.
+    """
+    *head, last = _split_message(text)
+    for part in head:
+        message.reply_text(part)
+    message.reply_text(last, reply_markup=reply_markup)
+
+
+def _more_events_kb(kind: str, owner_id: int, offset: int) -> InlineKeyboardMarkup:
+    """
+    Кнопка «Показать ещё» для следующей страницы списка.
+
+    :param kind: "all" — все события (только свои), "pub" — публичные события
+    :param offset: первая строка следующей страницы
+    """
     return InlineKeyboardMarkup(
-        [[InlineKeyboardButton("Отмена", callback_data="fsm:cancel")]]
+        [[InlineKeyboardButton("Показать ещё", callback_data=f"evp:{kind}:{owner_id}:{offset}")]]
     )
 
 
+def events_page_callback(update: Update, context: CallbackContext) -> None:
+    """
+    Обработчик «Показать ещё» (callback_data='evp:<all|pub>:<owner_id>:<offset>').
+    Следующая страница приходит новым сообщением; чужой полный список не отдаётся.
+    """
+    q = update.callback_query
+    try:
+        _, kind, owner, offset = q.data.split(":")
+        owner_id, offset = int(owner), int(offset)
+    except ValueError:
+        q.answer()
+        return
+
+    if kind == "all" and owner_id != q.from_user.id:
+        q.answer("Это не ваш список.")
+        return
+
+    try:
+        filters = {"user_id": owner_id} if kind == "all" else {"user_id": owner_id, "is_public": True}
+        rows = _event_rows(offset, **filters)
+        q.answer()
+        if not rows:
+            q.message.reply_text("Больше событий нет.")
+            return
+        more = offset + EVENT_LIST_LIMIT
+        _reply_long(
+            q.message,
+            _format_events_for_message(rows, offset),
+            reply_markup=_more_events_kb(kind, owner_id, more) if len(rows) > EVENT_LIST_LIMIT else None,
+        )
+        log.info("EVENTS_PAGE ok user_id=%s kind=%s owner_id=%s offset=%s", q.from_user.id, kind, owner_id, offset)
+    except Exception:
+        q.message.reply_text("Ошибка при получении списка событий.")
+        log.exception("EVENTS_PAGE failed user_id=%s data=%s", q.from_user.id, q.data)
+
+
+def _forget_events(owner_id: int) -> None:
+    """Сбросить кэш списков владельца после изменения его событий."""
+    with _EVENTS_TEXT_CACHE_LOCK:
+        _EVENTS_TEXT_CACHE.pop((owner_id, False), None)
+        _EVENTS_TEXT_CACHE.pop((owner_id, True), None)
+
+
+def _cancel_if_requested(update: Update, user_id: int, msg: str, flow: str) -> bool:
+    """
+    Если пользователь ввёл «Отмена» — сбросить состояние FSM и ответить.
+
+    :param flow: имя потока для лога (CREATE/EDIT/...)
+    :return: True, если диалог отменён и обработку нужно прекратить
+    """
+    if not is_cancel_text(msg):
+        return False
+    clear_state(user_id)
+    update.message.reply_text(_CANCELLED, reply_markup=_REMOVE_KB)
+    log.info("%s cancelled user_id=%s", flow, user_id)
+    return True
+
+
 def _send_with_inline_cancel(update: Update, text: str) -> None:
     """Отправить сообщение с inline-кнопкой «Отмена»."""
-    update.message.reply_text(text, reply_markup=_inline_cancel_kb())
+    update.message.reply_text(text, reply_markup=_INLINE_CANCEL_KB)
 
 
 def fsm_cancel_callback(update: Update, context: CallbackContext) -> None:
@@ -109,54 +329,60 @@ def fsm_cancel_callback(update: Update, context: CallbackContext) -> None:
             user_id = q.from_user.id
             clear_state(user_id)
             q.answer("Отменено")
-            q.edit_message_text("Операция отменена.")
+            q.edit_message_text(_CANCELLED)
             log.info("FSM cancel via inline: user_id=%s", user_id)
         else:
             user = update.effective_user
             clear_state(user.id)
             update.effective_message.reply_text(
-                "Операция отменена.", reply_markup=ReplyKeyboardRemove()
+                _CANCELLED, reply_markup=_REMOVE_KB
             )
             log.info("FSM cancel via message: user_id=%s", user.id)
     except Exception:
         log.exception("fsm_cancel_callback error")
 
 
+def _run_step(
+    update: Update,
+    user: Any,
+    msg: str,
+    flow: str,
+    steps: Dict[str, StepHandler],
+    state: StateDict,
+) -> None:
+    """
+    Выполнить текущий шаг FSM по таблице steps и сохранить переход.
+
+    Обработчик шага возвращает имя следующего шага (тот же — остаёмся на месте,
+    например при ошибке ввода) или None — диалог завершён, состояние сбрасывается.
+    """
+    step = state["step"]
+    handler = steps.get(step)
+    if handler is None:
+        return
+
+    next_step = handler(update, user, msg, state["data"])
+    if next_step is None:
+        clear_state(user.id)
+    elif next_step != step:
+        set_state(user.id, flow=flow, step=next_step, data=state["data"])
+
+
 # ---------------------------------------------------------------------------
 # БАЗОВЫЕ КОМАНДЫ
 # ---------------------------------------------------------------------------
 
 def start(update: Update, context: CallbackContext) -> None:
     """Краткая справка по командам."""
-    user = update.effective_user
-    log.info("/start user_id=%s @%s", getattr(user, "id", None), getattr(user, "username", ""))
-    update.message.reply_text(
-        "Календарь-бот.\n\n"
-        "Регистрация:\n"
-        "• /register — создать учётную запись\n\n"
-        "События:\n"
-        "• /create_event — создать событие (диалог)\n"
-        "• /display_events — показать мои события\n"
-        "• /read_event <id> — показать событие по ID\n"
-        "• /edit_event — изменить описание (диалог) или /edit_event <id> <новое>\n"
-        "• /delete_event — удалить (диалог) или /delete_event <id>\n\n"
-        "Публикация и экспорт:\n"
-        "• /share_event — сделать событие публичным (по ID)\n"
-        "• /my_public — мои публичные события\n"
-        "• /public_of — публичные события другого пользователя\n"
-        "• /export — выгрузка CSV/JSON\n\n"
-        "Встречи:\n"
-        "• /invite — приглашение на встречу (диалог)\n\n"
-        "Профиль и календарь:\n"
-        "• /login — привязать Telegram-аккаунт к системе\n"
-        "• /calendar — показать мой личный календарь\n\n"
-        "• /cancel — отменить текущую операцию"
-    )
+    if log.isEnabledFor(logging.INFO):
+        user = update.effective_user
+        log.info("/start user_id=%s @%s", getattr(user, "id", None), getattr(user, "username", ""))
+    update.message.reply_text(_HELP_TEXT)
 
 
 def help_command(update: Update, context: CallbackContext) -> None:
-    """Синоним /start — выводит те же подсказки."""
-    start(update, context)
+    """Синоним /start — выводит те же подсказки (готовый _HELP_TEXT)."""
+    update.message.reply_text(_HELP_TEXT)
 
 
 def register_command(update: Update, context: CallbackContext) -> None:
@@ -167,32 +393,24 @@ def register_command(update: Update, context: CallbackContext) -> None:
     """
     ensure_profile_from_update(update)
     user = update.effective_user
-    log.info("/register user_id=%s @%s", user.id, user.username)
+    # Поля пользователя читаем один раз и переиспользуем ниже
+    uid, uname, fname = user.id, user.username or "", user.first_name or ""
+    log.info("/register user_id=%s @%s", uid, uname)
 
     ok_db = True
     try:
         # Эта функция теперь сама управляет своим подключением
-        register_in_db_and_track(
-            update,
-            user_id=user.id,
-            username=user.username or "",
-            first_name=user.first_name or "",
-        )
-        log.info("users-table ensured/updated for user_id=%s", user.id)
+        register_in_db_and_track(update, user_id=uid, username=uname, first_name=fname)
+        log.info("users-table ensured/updated for user_id=%s", uid)
     except Exception:
         ok_db = False
-        log.exception("register_in_db_and_track failed for user_id=%s", user.id)
+        log.exception("register_in_db_and_track failed for user_id=%s", uid)
 
     try:
-        ensure_tg_user(
-            tg_id=user.id,
-            username=user.username,
-            first_name=user.first_name,
-            last_name=user.last_name,
-        )
-        log.info("TgUser ensured for user_id=%s", user.id)
+        ensure_tg_user(tg_id=uid, username=uname, first_name=fname, last_name=user.last_name)
+        log.info("TgUser ensured for user_id=%s", uid)
     except Exception:
-        log.exception("ensure_tg_user failed for user_id=%s", user.id)
+        log.exception("ensure_tg_user failed for user_id=%s", uid)
 
     if ok_db:
         update.message.reply_text("Регистрация выполнена. Можно работать со своим календарём.")
@@ -207,7 +425,7 @@ def cancel_command(update: Update, context: CallbackContext) -> None:
     user = update.effective_user
     clear_state(user.id)
     log.info("/cancel user_id=%s", user.id)
-    update.message.reply_text("Операция отменена.", reply_markup=ReplyKeyboardRemove())
+    update.message.reply_text(_CANCELLED, reply_markup=_REMOVE_KB)
 
 
 # ---------------------------------------------------------------------------
@@ -230,86 +448,84 @@ def create_event_start(update: Update, context: CallbackContext) -> None:
         return
 
     set_state(user.id, flow="CREATE", step="WAIT_NAME", data={})
-    update.message.reply_text("Введите название события:", reply_markup=CANCEL_KB)
+    update.message.reply_text(_PROMPTS["CREATE_NAME"], reply_markup=CANCEL_KB)
 
 
-def create_event_process(update: Update, context: CallbackContext, state: StateDict) -> None:
-    """Шаги FSM: WAIT_NAME -> WAIT_DATE -> WAIT_TIME -> WAIT_DETAILS."""
-    user = update.effective_user
-    msg = (update.message.text or "").strip()
-    step = state["step"]
-    data = state["data"]
-    log.debug("CREATE step=%s user_id=%s msg=%r", step, user.id, msg)
+def _create_wait_name(update: Update, user: Any, msg: str, data: Dict[str, Any]) -> Optional[str]:
+    data["name"] = msg
+    update.message.reply_text(_PROMPTS["CREATE_DATE"], reply_markup=CANCEL_KB)
+    return "WAIT_DATE"
 
-    if msg.lower() == "отмена":
-        clear_state(user.id)
-        update.message.reply_text("Операция отменена.", reply_markup=ReplyKeyboardRemove())
-        log.info("CREATE cancelled user_id=%s", user.id)
-        return
 
-    if step == "WAIT_NAME":
-        data["name"] = msg
-        set_state(user.id, flow="CREATE", step="WAIT_DATE", data=data)
-        update.message.reply_text("Введите дату в формате ГГГГ-ММ-ДД:", reply_markup=CANCEL_KB)
-        return
+def _create_wait_date(update: Update, user: Any, msg: str, data: Dict[str, Any]) -> Optional[str]:
+    date_str = parse_date(msg)
+    if not date_str:
+        update.message.reply_text(_PROMPTS["CREATE_DATE_BAD"], reply_markup=CANCEL_KB)
+        return "WAIT_DATE"
+    data["date"] = date_str
+    update.message.reply_text(_PROMPTS["CREATE_TIME"], reply_markup=CANCEL_KB)
+    return "WAIT_TIME"
 
-    if step == "WAIT_DATE":
-        date_str = parse_date(msg)
-        if not date_str:
-            update.message.reply_text(
-                "Неверный формат даты. Пример: 2025-12-03. Попробуйте ещё раз:",
-                reply_markup=CANCEL_KB,
-            )
-            return
-        data["date"] = date_str
-        set_state(user.id, flow="CREATE", step="WAIT_TIME", data=data)
-        update.message.reply_text("Введите время в формате ЧЧ:ММ (например, 14:30):", reply_markup=CANCEL_KB)
-        return
 
-    if step == "WAIT_TIME":
-        time_str = parse_time(msg)
-        if not time_str:
-            update.message.reply_text(
-                "Неверный формат времени. Пример: 09:05. Попробуйте ещё раз:",
-                reply_markup=CANCEL_KB,
-            )
-            return
-        data["time"] = time_str
-        set_state(user.id, flow="CREATE", step="WAIT_DETAILS", data=data)
-        update.message.reply_text("Введите описание события:", reply_markup=CANCEL_KB)
-        return
+def _create_wait_time(update: Update, user: Any, msg: str, data: Dict[str, Any]) -> Optional[str]:
+    time_str = parse_time(msg)
+    if not time_str:
+        update.message.reply_text(_PROMPTS["CREATE_TIME_BAD"], reply_markup=CANCEL_KB)
+        return "WAIT_TIME"
+    data["time"] = time_str
+    update.message.reply_text(_PROMPTS["CREATE_DETAILS"], reply_markup=CANCEL_KB)
+    return "WAIT_DETAILS"
 
-    if step == "WAIT_DETAILS":
-        data["details"] = msg
-        calendar = None
-        try:
-            # --- ИЗМЕНЕНИЕ: "Ленивое" получение ---
-            calendar = get_calendar()
-            event_id = calendar.create_event(
+
+def _create_wait_details(update: Update, user: Any, msg: str, data: Dict[str, Any]) -> Optional[str]:
+    data["details"] = msg
+    try:
+        with calendar_session() as calendar:
+            # Строка users создаётся тем же запросом, если её вдруг нет
+            # (например, удалена, пока шёл диалог) — без отдельной проверки.
+            event_id = calendar.create_event_ensuring_user(
                 user_id=user.id,
                 name=data["name"],
                 date_str=data["date"],
                 time_str=data["time"],
                 details=data["details"],
+                username=user.username or "",
+                first_name=user.first_name or "",
             )
-            track_event_created()
-            track_user_event_created(user.id)
             update.message.reply_text(
                 f"Событие создано. ID: {event_id}",
-                reply_markup=ReplyKeyboardRemove(),
+                reply_markup=_REMOVE_KB,
             )
+            record_event_action("created", user.id)
+            _forget_events(user.id)
             log.info("CREATE done user_id=%s event_id=%s", user.id, event_id)
-        except ValueError as err:
-            update.message.reply_text(str(err), reply_markup=ReplyKeyboardRemove())
-            log.warning("CREATE validation error user_id=%s err=%s", user.id, err)
-        except Exception:
-            update.message.reply_text("Не удалось создать событие.", reply_markup=ReplyKeyboardRemove())
-            log.exception("CREATE failed user_id=%s", user.id)
-        finally:
-            clear_state(user.id)
-            # --- ИЗМЕНЕНИЕ: Закрываем соединение ---
-            if calendar and calendar.conn:
-                calendar.conn.close()
+    except ValueError as err:
+        update.message.reply_text(str(err), reply_markup=_REMOVE_KB)
+        log.warning("CREATE validation error user_id=%s err=%s", user.id, err)
+    except Exception:
+        update.message.reply_text("Не удалось создать событие.", reply_markup=_REMOVE_KB)
+        log.exception("CREATE failed user_id=%s", user.id)
+    return None
+
+
+_CREATE_STEPS: Dict[str, StepHandler] = {
+    "WAIT_NAME": _create_wait_name,
+    "WAIT_DATE": _create_wait_date,
+    "WAIT_TIME": _create_wait_time,
+    "WAIT_DETAILS": _create_wait_details,
+}
+
+
+def create_event_process(update: Update, context: CallbackContext, state: StateDict) -> None:
+    """Шаги FSM: WAIT_NAME -> WAIT_DATE -> WAIT_TIME -> WAIT_DETAILS."""
+    user = update.effective_user
+    msg = (update.message.text or "").strip()
+    log.debug("CREATE step=%s user_id=%s msg=%r", state["step"], user.id, msg)
+
+    if _cancel_if_requested(update, user.id, msg, "CREATE"):
+        return
+
+    _run_step(update, user, msg, "CREATE", _CREATE_STEPS, state)
 
 
 # ---------------------------------------------------------------------------
@@ -328,20 +544,14 @@ def display_events_handler(update: Update, context: CallbackContext) -> None:
     ):
         return
 
-    calendar = None
     try:
-        # --- ИЗМЕНЕНИЕ: "Ленивое" получение ---
-        calendar = get_calendar()
-        res = calendar.display_events(user.id)
-        update.message.reply_text(res)
-        log.info("DISPLAY_EVENTS ok user_id=%s", user.id)
+        with calendar_session() as calendar:
+            res = calendar.display_events(user.id)
+            _reply_long(update.message, res)
+            log.info("DISPLAY_EVENTS ok user_id=%s", user.id)
     except Exception:
         update.message.reply_text("Ошибка при получении списка событий.")
         log.exception("DISPLAY_EVENTS failed user_id=%s", user.id)
-    finally:
-        # --- ИЗМЕНЕНИЕ: Закрываем соединение ---
-        if calendar and calendar.conn:
-            calendar.conn.close()
 
 
 def read_event_handler(update: Update, context: CallbackContext) -> None:
@@ -349,37 +559,66 @@ def read_event_handler(update: Update, context: CallbackContext) -> None:
     ensure_profile_from_update(update)
     user = update.effective_user
 
-    parts = (update.message.text or "").split(maxsplit=1)
-    if len(parts) < 2:
+    # Аргументы команды уже разобраны CommandHandler'ом в context.args
+    if not context.args:
         update.message.reply_text("Формат: /read_event <id>")
         return
 
-    try:
-        event_id = int(parts[1])
-    except ValueError:
-        update.message.reply_text("ID должен быть числом.")
+    event_id = parse_id(context.args[0])
+    if event_id is None:
+        update.message.reply_text(_PROMPTS["BAD_ID"])
         return
 
-    calendar = None
     try:
-        # --- ИЗМЕНЕНИЕ: "Ленивое" получение ---
-        calendar = get_calendar()
-        res = calendar.read_event(user.id, event_id)
-        update.message.reply_text(res or "Событие не найдено.")
-        log.info("READ_EVENT ok user_id=%s event_id=%s", user.id, event_id)
+        with calendar_session() as calendar:
+            res = calendar.read_event(user.id, event_id)
+            update.message.reply_text(res or "Событие не найдено.")
+            log.info("READ_EVENT ok user_id=%s event_id=%s", user.id, event_id)
     except Exception:
         update.message.reply_text("Ошибка при чтении события.")
         log.exception("READ_EVENT failed user_id=%s event_id=%s", user.id, event_id)
-    finally:
-        # --- ИЗМЕНЕНИЕ: Закрываем соединение ---
-        if calendar and calendar.conn:
-            calendar.conn.close()
 
 
 # ---------------------------------------------------------------------------
 # РЕДАКТИРОВАНИЕ СОБЫТИЯ
 # ---------------------------------------------------------------------------
 
+def _edit_event_start(update: Update, context: CallbackContext, user: Any) -> None:
+    """/edit_event без параметров: FSM WAIT_ID -> WAIT_NEW_DETAILS."""
+    set_state(user.id, flow="EDIT", step="WAIT_ID", data={})
+    update.message.reply_text(_PROMPTS["EDIT_ID"], reply_markup=CANCEL_KB)
+
+
+def _edit_event_inline(update: Update, context: CallbackContext, user: Any) -> None:
+    """/edit_event <id> <новое описание>: изменить сразу, без диалога."""
+    # ID берём из context.args, а описание — из исходного текста,
+    # чтобы сохранить его пробелы и переносы строк
+    new_text = update.message.text.split(None, 2)[2]
+    event_id = parse_id(context.args[0])
+    if event_id is None:
+        update.message.reply_text(_PROMPTS["BAD_ID"])
+        return
+
+    try:
+        with calendar_session() as calendar:
+            ok = calendar.edit_event(user.id, event_id, new_text)
+            if ok:
+                update.message.reply_text("Описание обновлено.")
+                record_event_action("edited", user.id)
+                _forget_events(user.id)
+                log.info("EDIT inline ok user_id=%s event_id=%s", user.id, event_id)
+            else:
+                update.message.reply_text("Событие не найдено.")
+                log.info("EDIT inline not_found user_id=%s event_id=%s", user.id, event_id)
+    except Exception:
+        update.message.reply_text("Ошибка при изменении события.")
+        log.exception("EDIT inline failed user_id=%s event_id=%s", user.id, event_id)
+
+
+# Режим по наличию параметров: [False] — диалог, [True] — inline
+_EDIT_MODES = (_edit_event_start, _edit_event_inline)
+
+
 def edit_event_start_or_inline(update: Update, context: CallbackContext) -> None:
     """
     Редактирование описания:
@@ -397,39 +636,41 @@ def edit_event_start_or_inline(update: Update, context: CallbackContext) -> None
     ):
         return
 
-    parts = (update.message.text or "").split(maxsplit=2)
-    if len(parts) >= 3:
-        try:
-            event_id = int(parts[1])
-        except ValueError:
-            update.message.reply_text("ID должен быть числом.")
-            return
+    _EDIT_MODES[len(context.args) >= 2](update, context, user)
 
-        new_text = parts[2]
-        calendar = None
-        try:
-            # --- ИЗМЕНЕНИЕ: "Ленивое" получение ---
-            calendar = get_calendar()
-            ok = calendar.edit_event(user.id, event_id, new_text)
-            if ok:
-                track_event_edited()
-                track_user_event_edited(user.id)
-                update.message.reply_text("Описание обновлено.")
-                log.info("EDIT inline ok user_id=%s event_id=%s", user.id, event_id)
-            else:
-                update.message.reply_text("Событие не найдено.")
-                log.info("EDIT inline not_found user_id=%s event_id=%s", user.id, event_id)
-        except Exception:
-            update.message.reply_text("Ошибка при изменении события.")
-            log.exception("EDIT inline failed user_id=%s event_id=%s", user.id, event_id)
-        finally:
-            # --- ИЗМЕНЕНИЕ: Закрываем соединение ---
-            if calendar and calendar.conn:
-                calendar.conn.close()
-        return
 
-    set_state(user.id, flow="EDIT", step="WAIT_ID", data={})
-    update.message.reply_text("Введите ID события для изменения описания:", reply_markup=CANCEL_KB)
+def _edit_wait_id(update: Update, user: Any, msg: str, data: Dict[str, Any]) -> Optional[str]:
+    event_id = parse_id(msg)
+    if event_id is None:
+        update.message.reply_text(_PROMPTS["BAD_ID_RETRY"], reply_markup=CANCEL_KB)
+        return "WAIT_ID"
+
+    # Владение проверяет сам UPDATE на следующем шаге (WHERE id AND user_id):
+    # отдельный SELECT здесь был бы лишним обращением к БД
+    data["id"] = event_id
+    update.message.reply_text(_PROMPTS["EDIT_DETAILS"], reply_markup=CANCEL_KB)
+    return "WAIT_NEW_DETAILS"
+
+
+def _edit_wait_new_details(update: Update, user: Any, msg: str, data: Dict[str, Any]) -> Optional[str]:
+    with calendar_session() as calendar:
+        ok = calendar.edit_event(user.id, data["id"], msg)
+
+    if ok:
+        update.message.reply_text("Описание обновлено.", reply_markup=_REMOVE_KB)
+        record_event_action("edited", user.id)
+        _forget_events(user.id)
+        log.info("EDIT done user_id=%s event_id=%s", user.id, data["id"])
+    else:
+        update.message.reply_text("Событие не найдено или не принадлежит вам.", reply_markup=_REMOVE_KB)
+        log.info("EDIT wrong_owner/not_found user_id=%s event_id=%s", user.id, data["id"])
+    return None
+
+
+_EDIT_STEPS: Dict[str, StepHandler] = {
+    "WAIT_ID": _edit_wait_id,
+    "WAIT_NEW_DETAILS": _edit_wait_new_details,
+}
 
 
 def edit_event_process(update: Update, context: CallbackContext, state: StateDict) -> None:
@@ -439,64 +680,54 @@ def edit_event_process(update: Update, context: CallbackContext, state: StateDic
     msg = (update.message.text or "").strip()
     log.debug("EDIT step=%s user_id=%s msg=%r", state["step"], user.id, msg)
 
-    if msg.lower() == "отмена":
-        clear_state(user.id)
-        update.message.reply_text("Операция отменена.", reply_markup=ReplyKeyboardRemove())
-        log.info("EDIT cancelled user_id=%s", user.id)
+    if _cancel_if_requested(update, user.id, msg, "EDIT"):
         return
 
-    calendar = None
     try:
-        if state["step"] == "WAIT_ID":
-            try:
-                event_id = int(msg)
-            except ValueError:
-                update.message.reply_text("ID должен быть числом. Введите ID:", reply_markup=CANCEL_KB)
-                return
-
-            # --- ИЗМЕНЕНИЕ: "Ленивое" получение ---
-            calendar = get_calendar()
-            preview = calendar.read_event(user.id, event_id)
-            if not preview:
-                update.message.reply_text(
-                    "Это событие вам не принадлежит или не существует. Укажите свой event_id:",
-                    reply_markup=CANCEL_KB,
-                )
-                log.info("EDIT wrong_owner/not_found user_id=%s event_id=%s", user.id, event_id)
-                return
-
-            set_state(user.id, flow="EDIT", step="WAIT_NEW_DETAILS", data={"id": event_id})
-            update.message.reply_text("Введите новое описание:", reply_markup=CANCEL_KB)
-            return
-
-        if state["step"] == "WAIT_NEW_DETAILS":
-            # --- ИЗМЕНЕНИЕ: "Ленивое" получение ---
-            calendar = get_calendar()
-            ok = calendar.edit_event(user.id, state["data"]["id"], msg)
-            if ok:
-                track_event_edited()
-                track_user_event_edited(user.id)
-                update.message.reply_text("Описание обновлено.", reply_markup=ReplyKeyboardRemove())
-                log.info("EDIT done user_id=%s event_id=%s", user.id, state["data"]["id"])
-            else:
-                update.message.reply_text("Событие не найдено.", reply_markup=ReplyKeyboardRemove())
-                log.info("EDIT not_found user_id=%s event_id=%s", user.id, state["data"]["id"])
-            clear_state(user.id)
-
+        _run_step(update, user, msg, "EDIT", _EDIT_STEPS, state)
     except Exception:
-        update.message.reply_text("Ошибка при изменении события.", reply_markup=ReplyKeyboardRemove())
+        update.message.reply_text("Ошибка при изменении события.", reply_markup=_REMOVE_KB)
         log.exception("EDIT failed user_id=%s data=%s", user.id, state.get("data"))
         clear_state(user.id)
-    finally:
-        # --- ИЗМЕНЕНИЕ: Закрываем соединение ---
-        if calendar and calendar.conn:
-            calendar.conn.close()
 
 
 # ---------------------------------------------------------------------------
 # УДАЛЕНИЕ СОБЫТИЯ
 # ---------------------------------------------------------------------------
 
+def _delete_event_start(update: Update, context: CallbackContext, user: Any) -> None:
+    """/delete_event без параметров: FSM WAIT_ID."""
+    set_state(user.id, flow="DELETE", step="WAIT_ID", data={})
+    update.message.reply_text(_PROMPTS["DELETE_ID"], reply_markup=CANCEL_KB)
+
+
+def _delete_event_inline(update: Update, context: CallbackContext, user: Any) -> None:
+    """/delete_event <id>: удалить сразу, без диалога."""
+    event_id = parse_id(context.args[0])
+    if event_id is None:
+        update.message.reply_text(_PROMPTS["BAD_ID"])
+        return
+
+    try:
+        with calendar_session() as calendar:
+            ok = calendar.delete_event(user.id, event_id)
+            if ok:
+                update.message.reply_text("Событие удалено.")
+                record_event_action("cancelled", user.id)
+                _forget_events(user.id)
+                log.info("DELETE inline ok user_id=%s event_id=%s", user.id, event_id)
+            else:
+                update.message.reply_text("Событие не найдено.")
+                log.info("DELETE inline not_found user_id=%s event_id=%s", user.id, event_id)
+    except Exception:
+        update.message.reply_text("Ошибка при удалении события.")
+        log.exception("DELETE inline failed user_id=%s event_id=%s", user.id, event_id)
+
+
+# Режим по наличию параметров: [False] — диалог, [True] — inline
+_DELETE_MODES = (_delete_event_start, _delete_event_inline)
+
+
 def delete_event_start_or_inline(update: Update, context: CallbackContext) -> None:
     """
     Удаление события:
@@ -514,38 +745,35 @@ def delete_event_start_or_inline(update: Update, context: CallbackContext) -> No
     ):
         return
 
-    parts = (update.message.text or "").split(maxsplit=1)
-    if len(parts) == 2:
-        try:
-            event_id = int(parts[1])
-        except ValueError:
-            update.message.reply_text("ID должен быть числом.")
-            return
+    _DELETE_MODES[bool(context.args)](update, context, user)
+
+
+def _delete_wait_id(update: Update, user: Any, msg: str, data: Dict[str, Any]) -> Optional[str]:
+    event_id = parse_id(msg)
+    if event_id is None:
+        update.message.reply_text(_PROMPTS["BAD_ID_RETRY"], reply_markup=CANCEL_KB)
+        return "WAIT_ID"
 
-        calendar = None
-        try:
-            # --- ИЗМЕНЕНИЕ: "Ленивое" получение ---
-            calendar = get_calendar()
+    try:
+        with calendar_session() as calendar:
             ok = calendar.delete_event(user.id, event_id)
             if ok:
-                track_event_cancelled()
-                track_user_event_cancelled(user.id)
-                update.message.reply_text("Событие удалено.")
-                log.info("DELETE inline ok user_id=%s event_id=%s", user.id, event_id)
+                update.message.reply_text("Событие удалено.", reply_markup=_REMOVE_KB)
+                record_event_action("cancelled", user.id)
+                _forget_events(user.id)
+                log.info("DELETE done user_id=%s event_id=%s", user.id, event_id)
             else:
-                update.message.reply_text("Событие не найдено.")
-                log.info("DELETE inline not_found user_id=%s event_id=%s", user.id, event_id)
-        except Exception:
-            update.message.reply_text("Ошибка при удалении события.")
-            log.exception("DELETE inline failed user_id=%s event_id=%s", user.id, event_id)
-        finally:
-            # --- ИЗМЕНЕНИЕ: Закрываем соединение ---
-            if calendar and calendar.conn:
-                calendar.conn.close()
-        return
+                update.message.reply_text("Событие не найдено.", reply_markup=_REMOVE_KB)
+                log.info("DELETE not_found user_id=%s event_id=%s", user.id, event_id)
+    except Exception:
+        update.message.reply_text("Ошибка при удалении события.", reply_markup=_REMOVE_KB)
+        log.exception("DELETE failed user_id=%s event_id=%s", user.id, event_id)
+    return None
 
-    set_state(user.id, flow="DELETE", step="WAIT_ID", data={})
-    update.message.reply_text("Введите ID события для удаления:", reply_markup=CANCEL_KB)
+
+_DELETE_STEPS: Dict[str, StepHandler] = {
+    "WAIT_ID": _delete_wait_id,
+}
 
 
 def delete_event_process(update: Update, context: CallbackContext, state: StateDict) -> None:
@@ -555,40 +783,10 @@ def delete_event_process(update: Update, context: CallbackContext, state: StateD
     msg = (update.message.text or "").strip()
     log.debug("DELETE step=%s user_id=%s msg=%r", state["step"], user.id, msg)
 
-    if msg.lower() == "отмена":
-        clear_state(user.id)
-        update.message.reply_text("Операция отменена.", reply_markup=ReplyKeyboardRemove())
-        log.info("DELETE cancelled user_id=%s", user.id)
+    if _cancel_if_requested(update, user.id, msg, "DELETE"):
         return
 
-    if state["step"] == "WAIT_ID":
-        try:
-            event_id = int(msg)
-        except ValueError:
-            update.message.reply_text("ID должен быть числом. Введите ID:", reply_markup=CANCEL_KB)
-            return
-
-        calendar = None
-        try:
-            # --- ИЗМЕНЕНИЕ: "Ленивое" получение ---
-            calendar = get_calendar()
-            ok = calendar.delete_event(user.id, event_id)
-            if ok:
-                track_event_cancelled()
-                track_user_event_cancelled(user.id)
-                update.message.reply_text("Событие удалено.", reply_markup=ReplyKeyboardRemove())
-                log.info("DELETE done user_id=%s event_id=%s", user.id, event_id)
-            else:
-                update.message.reply_text("Событие не найдено.", reply_markup=ReplyKeyboardRemove())
-                log.info("DELETE not_found user_id=%s event_id=%s", user.id, event_id)
-        except Exception:
-            update.message.reply_text("Ошибка при удалении события.", reply_markup=ReplyKeyboardRemove())
-            log.exception("DELETE failed user_id=%s event_id=%s", user.id, event_id)
-        finally:
-            clear_state(user.id)
-            # --- ИЗМЕНЕНИЕ: Закрываем соединение ---
-            if calendar and calendar.conn:
-                calendar.conn.close()
+    _run_step(update, user, msg, "DELETE", _DELETE_STEPS, state)
 
 
 # ---------------------------------------------------------------------------
@@ -605,16 +803,15 @@ def login_command(update: Update, context: CallbackContext) -> None:
     u = update.effective_user
 
     if context.args:
-        try:
-            arg_id = int(context.args[0])
-            if arg_id != u.id:
-                update.message.reply_text(
-                    "Можно привязать только свой аккаунт. Использую ваш текущий Telegram ID."
-                )
-        except ValueError:
+        arg_id = parse_id(context.args[0])
+        if arg_id is None:
             update.message.reply_text(
                 "ID должен быть числом. Игнорирую аргумент и использую ваш Telegram ID."
             )
+        elif arg_id != u.id:
+            update.message.reply_text(
+                "Можно привязать только свой аккаунт. Использую ваш текущий Telegram ID."
+            )
 
     try:
         ensure_tg_user(u.id, u.username, u.first_name, u.last_name)
@@ -631,18 +828,20 @@ def calendar_command(update: Update, context: CallbackContext) -> None:
     """/calendar — показать личный календарь (ORM Event), фильтр по user_id."""
     ensure_profile_from_update(update)
     u = update.effective_user
-    ensure_tg_user(u.id, u.username, u.first_name, u.last_name)
 
     try:
-        qs = Event.objects.filter(user_id=u.id).order_by("date", "time", "id")
-        if not qs.exists():
+        text, count = _events_text(u.id)
+        if not text:
             update.message.reply_text("Ваш календарь пуст.")
             log.info("CALENDAR empty user_id=%s", u.id)
             return
 
-        msg = "Ваши события:\n\n" + _format_events_for_message(qs)
-        update.message.reply_text(msg)
-        log.info("CALENDAR ok user_id=%s count=%s", u.id, qs.count())
+        _reply_long(
+            update.message,
+            "Ваши события:\n\n" + text,
+            reply_markup=_more_events_kb("all", u.id, EVENT_LIST_LIMIT) if count > EVENT_LIST_LIMIT else None,
+        )
+        log.info("CALENDAR ok user_id=%s count=%s", u.id, count)
     except Exception:
         update.message.reply_text("Ошибка при получении календаря.")
         log.exception("CALENDAR failed user_id=%s", u.id)
@@ -666,58 +865,65 @@ def share_event_start(update: Update, context: CallbackContext) -> None:
     log.info("SHARE start user_id=%s", u.id)
 
 
+def _share_wait_event_id(update: Update, user: Any, msg: str, data: Dict[str, Any]) -> Optional[str]:
+    event_id = parse_id(msg)
+    if event_id is None:
+        update.message.reply_text(_PROMPTS["BAD_ID_RETRY"], reply_markup=_INLINE_CANCEL_KB)
+        return "WAIT_EVENT_ID"
+
+    try:
+        # Используем ORM-модель Event для обновления
+        updated = Event.objects.filter(id=event_id, user_id=user.id).update(is_public=True)
+        if updated:
+            _forget_events(user.id)
+            update.message.reply_text(
+                "Готово: событие теперь видно другим. "
+                "Посмотреть список своих публичных событий — /my_public."
+            )
+            log.info("SHARE ok user_id=%s event_id=%s", user.id, event_id)
+        else:
+            update.message.reply_text("Событие не найдено или не принадлежит вам.")
+            log.info("SHARE not_found/forbidden user_id=%s event_id=%s", user.id, event_id)
+    except Exception:
+        update.message.reply_text("Не удалось изменить видимость события.")
+        log.exception("SHARE failed user_id=%s event_id=%s", user.id, event_id)
+    return None
+
+
+_SHARE_STEPS: Dict[str, StepHandler] = {
+    "WAIT_EVENT_ID": _share_wait_event_id,
+}
+
+
 def share_public_process(update: Update, context: CallbackContext, state: StateDict) -> None:
     """FSM: получить ID, проверить владение, поставить is_public=True (ORM)."""
     u = update.effective_user
     msg = (update.message.text or "").strip()
     log.debug("SHARE step=%s user_id=%s msg=%r", state["step"], u.id, msg)
 
-    if msg.lower() == "отмена":
-        clear_state(u.id)
-        update.message.reply_text("Операция отменена.", reply_markup=ReplyKeyboardRemove())
-        log.info("SHARE cancelled user_id=%s", u.id)
+    if _cancel_if_requested(update, u.id, msg, "SHARE"):
         return
 
-    if state["step"] == "WAIT_EVENT_ID":
-        try:
-            event_id = int(msg)
-        except ValueError:
-            update.message.reply_text("ID должен быть числом. Введите ID:", reply_markup=_inline_cancel_kb())
-            return
-
-        try:
-            # Используем ORM-модель Event для обновления
-            updated = Event.objects.filter(id=event_id, user_id=u.id).update(is_public=True)
-            if updated:
-                update.message.reply_text(
-                    "Готово: событие теперь видно другим. "
-                    "Посмотреть список своих публичных событий — /my_public."
-                )
-                log.info("SHARE ok user_id=%s event_id=%s", u.id, event_id)
-            else:
-                update.message.reply_text("Событие не найдено или не принадлежит вам.")
-                log.info("SHARE not_found/forbidden user_id=%s event_id=%s", u.id, event_id)
-        except Exception:
-            update.message.reply_text("Не удалось изменить видимость события.")
-            log.exception("SHARE failed user_id=%s event_id=%s", u.id, event_id)
-        finally:
-            clear_state(u.id)
+    _run_step(update, u, msg, "SHARE_PUBLIC", _SHARE_STEPS, state)
 
 
 def list_my_public_command(update: Update, context: CallbackContext) -> None:
     """/my_public — вывести список публичных событий текущего пользователя."""
     ensure_profile_from_update(update)
     u = update.effective_user
-    ensure_tg_user(u.id, u.username, u.first_name, u.last_name)
 
     try:
-        qs = Event.objects.filter(user_id=u.id, is_public=True).order_by("date", "time", "id")
-        if not qs.exists():
+        text, count = _events_text(u.id, public_only=True)
+        if not text:
             update.message.reply_text("У вас нет публичных событий.")
             log.info("MY_PUBLIC empty user_id=%s", u.id)
             return
-        update.message.reply_text("Ваши публичные события:\n\n" + _format_events_for_message(qs))
-        log.info("MY_PUBLIC ok user_id=%s count=%s", u.id, qs.count())
+        _reply_long(
+            update.message,
+            "Ваши публичные события:\n\n" + text,
+            reply_markup=_more_events_kb("pub", u.id, EVENT_LIST_LIMIT) if count > EVENT_LIST_LIMIT else None,
+        )
+        log.info("MY_PUBLIC ok user_id=%s count=%s", u.id, count)
     except Exception:
         update.message.reply_text("Ошибка при получении публичных событий.")
         log.exception("MY_PUBLIC failed user_id=%s", u.id)
@@ -727,51 +933,64 @@ def public_of_start(update: Update, context: CallbackContext) -> None:
     """/public_of — FSM: спросить tg_id пользователя для просмотра его публичных событий."""
     ensure_profile_from_update(update)
     u = update.effective_user
-    ensure_tg_user(u.id, u.username, u.first_name, u.last_name)
 
     set_state(u.id, flow="PUBLIC_OF", step="WAIT_TG_ID", data={})
     _send_with_inline_cancel(update, "Введите Telegram ID пользователя, чьи публичные события хотите посмотреть.")
     log.info("PUBLIC_OF start user_id=%s", u.id)
 
 
+def _public_of_wait_tg_id(update: Update, user: Any, msg: str, data: Dict[str, Any]) -> Optional[str]:
+    target_id = parse_id(msg)
+    if target_id is None:
+        update.message.reply_text("ID должен быть числом. Введите Telegram ID:", reply_markup=_INLINE_CANCEL_KB)
+        return "WAIT_TG_ID"
+
+    try:
+        text, count = _events_text(target_id, public_only=True)
+        if not text:
+            update.message.reply_text("У пользователя нет публичных событий.")
+            log.info("PUBLIC_OF empty user_id=%s target_id=%s", user.id, target_id)
+        else:
+            _reply_long(
+                update.message,
+                "Публичные события пользователя:\n\n" + text,
+                reply_markup=(
+                    _more_events_kb("pub", target_id, EVENT_LIST_LIMIT) if count > EVENT_LIST_LIMIT else None
+                ),
+            )
+            log.info("PUBLIC_OF ok user_id=%s target_id=%s", user.id, target_id)
+    except Exception:
+        update.message.reply_text("Ошибка при получении публичных событий.")
+        log.exception("PUBLIC_OF failed user_id=%s target_id=%s", user.id, target_id)
+    return None
+
+
+_PUBLIC_OF_STEPS: Dict[str, StepHandler] = {
+    "WAIT_TG_ID": _public_of_wait_tg_id,
+}
+
+
 def public_of_process(update: Update, context: CallbackContext, state: StateDict) -> None:
     """FSM: получить tg_id и вывести публичные события."""
     u = update.effective_user
     msg = (update.message.text or "").strip()
     log.debug("PUBLIC_OF step=%s user_id=%s msg=%r", state["step"], u.id, msg)
 
-    if msg.lower() == "отмена":
-        clear_state(u.id)
-        update.message.reply_text("Операция отменена.", reply_markup=ReplyKeyboardRemove())
-        log.info("PUBLIC_OF cancelled user_id=%s", u.id)
+    if _cancel_if_requested(update, u.id, msg, "PUBLIC_OF"):
         return
 
-    if state["step"] == "WAIT_TG_ID":
-        try:
-            target_id = int(msg)
-        except ValueError:
-            update.message.reply_text("ID должен быть числом. Введите Telegram ID:", reply_markup=_inline_cancel_kb())
-            return
-
-        try:
-            qs = Event.objects.filter(user_id=target_id, is_public=True).order_by("date", "time", "id")
-            if not qs.exists():
-                update.message.reply_text("У пользователя нет публичных событий.")
-                log.info("PUBLIC_OF empty user_id=%s target_id=%s", u.id, target_id)
-            else:
-                update.message.reply_text("Публичные события пользователя:\n\n" + _format_events_for_message(qs))
-                log.info("PUBLIC_OF ok user_id=%s target_id=%s count=%s", u.id, target_id, qs.count())
-        except Exception:
-            update.message.reply_text("Ошибка при получении публичных событий.")
-            log.exception("PUBLIC_OF failed user_id=%s target_id=%s", u.id, target_id)
-        finally:
-            clear_state(u.id)
+    _run_step(update, u, msg, "PUBLIC_OF", _PUBLIC_OF_STEPS, state)
 
 
 # ---------------------------------------------------------------------------
 # ЭКСПОРТ (Task 6)
 # ---------------------------------------------------------------------------
 
+# Настройки экспорта читаются один раз при импорте
+_EXPORT_BASE_URL = getattr(settings, "SITE_BASE_URL", "http://127.0.0.1:8000").rstrip("/")
+_EXPORT_TOKEN_MAX_AGE = getattr(settings, "EXPORT_TOKEN_MAX_AGE", 900)
+
+
 def export_command(update: Update, context: CallbackContext) -> None:
     """
     /export — выдаёт пользователю две ссылки-кнопки для скачивания:
@@ -781,14 +1000,13 @@ def export_command(update: Update, context: CallbackContext) -> None:
     """
     ensure_profile_from_update(update)
     u = update.effective_user
-    ensure_tg_user(u.id, u.username, u.first_name, u.last_name)
 
     try:
+        # Токен TimestampSigner: "<tg_id>:<время>:<подпись>", все символы из
+        # [A-Za-z0-9_:-] допустимы в query как есть — quote_plus не нужен
         token = make_export_token(u.id)
-        q = quote_plus(token)
-        base = getattr(settings, "SITE_BASE_URL", "http://127.0.0.1:8000").rstrip("/")
-        url_csv = f"{base}/export/csv/?token={q}"
-        url_json = f"{base}/export/json/?token={q}"
+        url_csv = f"{_EXPORT_BASE_URL}/export/csv/?token={token}"
+        url_json = f"{_EXPORT_BASE_URL}/export/json/?token={token}"
 
         kb = InlineKeyboardMarkup([
             [InlineKeyboardButton("⬇️ CSV", url=url_csv)],
@@ -796,7 +1014,7 @@ def export_command(update: Update, context: CallbackContext) -> None:
         ])
         update.message.reply_text(
             "Экспорт календаря:\n"
-            f"• ссылка активна ~{getattr(settings, 'EXPORT_TOKEN_MAX_AGE', 900)} сек.\n"
+            f"• ссылка активна ~{_EXPORT_TOKEN_MAX_AGE} сек.\n"
             "• выгрузка откроется в браузере.",
             reply_markup=kb,
         )
@@ -810,12 +1028,30 @@ def export_command(update: Update, context: CallbackContext) -> None:
 # РОУТЕР ТЕКСТОВ (FSM)
 # ---------------------------------------------------------------------------
 
+FlowHandler = Callable[[Update, CallbackContext, StateDict], None]
+
+# Обработчики текстов по активному FSM-потоку: один поиск в словаре вместо цепочки if
+_FLOW_DISPATCH: Dict[str, FlowHandler] = {
+    "CREATE": create_event_process,
+    "EDIT": edit_event_process,
+    "DELETE": delete_event_process,
+    "INVITE": appt.invite_process,
+    "SHARE_PUBLIC": share_public_process,
+    "PUBLIC_OF": public_of_process,
+}
+
+
 def text_router(update: Update, context: CallbackContext) -> None:
     """
     Роутер FSM: направляет текст пользователя в нужный обработчик
     в зависимости от активного потока (CREATE/EDIT/DELETE/INVITE/SHARE_PUBLIC/PUBLIC_OF).
     Если пользователь вне FSM — напоминаем про /help.
     """
+    # Страховка поверх фильтра: только обычный текст, не команды
+    message = update.effective_message
+    if message is None or not message.text or message.text.startswith("/"):
+        return
+
     user = update.effective_user
     state = get_state(user.id)  # <-- Вы получаете user.id здесь
     flow = state.get("flow")
@@ -828,24 +1064,9 @@ def text_router(update: Update, context: CallbackContext) -> None:
     # --- ИСПРАВЛЕНО ---
     log.debug("text_router user_id=%s flow=%s step=%s", user.id, flow, state.get("step"))
 
-    if flow == "CREATE":
-        create_event_process(update, context, state)
-        return
-    if flow == "EDIT":
-        edit_event_process(update, context, state)
-        return
-    if flow == "DELETE":
-        delete_event_process(update, context, state)
-        return
-    if flow == "INVITE":
-        # Этот роутер делегирует обработку другому модулю
-        appt.invite_process(update, context)
-        return
-    if flow == "SHARE_PUBLIC":
-        share_public_process(update, context, state)
-        return
-    if flow == "PUBLIC_OF":
-        public_of_process(update, context, state)
+    handler = _FLOW_DISPATCH.get(flow)
+    if handler is not None:
+        handler(update, context, state)
         return
 
     # --- ИСПРАВЛЕНО ---
@@ -859,30 +1080,54 @@ def text_router(update: Update, context: CallbackContext) -> None:
 # Регистрация (если нужно регать тут)
 # ---------------------------------------------------------------------------
 
-def register(dp) -> None:
-    """Опциональная регистрация обработчиков на Dispatcher."""
+# Фильтр FSM-роутера: любой текст, включая команды — отдельный
+# ~Filters.command не нужен. Команды из сообщений раньше забирает
+# command_router (MessageHandler(COMMAND_FILTER) регистрируется первым в той же
+# группе Dispatcher); команды из постов каналов и любые «/...» на случай иной
+# регистрации text_router отсекает сам сравнением первого символа — без
+# повторного обхода message.entities.
+_FSM_TEXT_FILTER = Filters.text
+
+# Команды модуля: имя -> (хендлер, run_async). Команды, которые меняют состояние
+# диалога (set_state/clear_state), идут через per_user_serial — в ту же очередь
+# пользователя, что и FSM-тексты: «/create_event» и сразу за ним название
+# обрабатываются строго по порядку, /cancel не обгоняет старт диалога.
+# Остальные команды с обращениями к БД — run_async=True (пул воркеров
+# Dispatcher); /start и /help только ставят готовый текст в очередь отправки
+# и выполняются сразу.
+COMMANDS: CommandTable = {
     # Базовые
-    dp.add_handler(CommandHandler("start", start))
-    dp.add_handler(CommandHandler("help", help_command))
-    dp.add_handler(CommandHandler("register", register_command))
-    dp.add_handler(CommandHandler("cancel", cancel_command))
-
+    "start": (start, False),
+    "help": (help_command, False),
+    "register": (register_command, True),
+    "cancel": (per_user_serial(cancel_command), False),
     # CRUD
-    dp.add_handler(CommandHandler("create_event", create_event_start))
-    dp.add_handler(CommandHandler("display_events", display_events_handler))
-    dp.add_handler(CommandHandler("read_event", read_event_handler))
-    dp.add_handler(CommandHandler("edit_event", edit_event_start_or_inline))
-    dp.add_handler(CommandHandler("delete_event", delete_event_start_or_inline))
-
+    "create_event": (per_user_serial(create_event_start), False),
+    "display_events": (display_events_handler, True),
+    "read_event": (read_event_handler, True),
+    "edit_event": (per_user_serial(edit_event_start_or_inline), False),
+    "delete_event": (per_user_serial(delete_event_start_or_inline), False),
     # Профиль/календарь
-    dp.add_handler(CommandHandler("login", login_command))
-    dp.add_handler(CommandHandler("calendar", calendar_command))
-
+    "login": (login_command, True),
+    "calendar": (calendar_command, True),
     # Публикация и экспорт
-    dp.add_handler(CommandHandler("share_event", share_event_start))
-    dp.add_handler(CommandHandler("my_public", list_my_public_command))
-    dp.add_handler(CommandHandler("public_of", public_of_start))
-    dp.add_handler(CommandHandler("export", export_command))
+    "share_event": (per_user_serial(share_event_start), False),
+    "my_public": (list_my_public_command, True),
+    "public_of": (per_user_serial(public_of_start), False),
+    "export": (export_command, True),
+}
+
+
+def register(dp) -> None:
+    """
+    Опциональная регистрация обработчиков на Dispatcher.
+
+    Все команды обслуживает один хендлер (command_router по таблице COMMANDS);
+    FSM-роутер идёт через per_user_serial: шаги диалога одного
+    пользователя идут по порядку, разные пользователи — параллельно.
+    """
+    dp.add_handler(MessageHandler(COMMAND_FILTER, command_router(COMMANDS)))
+    dp.add_handler(CallbackQueryHandler(with_fresh_db(events_page_callback), pattern=r"^evp:", run_async=True))
 
     # FSM-роутер
-    dp.add_handler(MessageHandler(Filters.text & ~Filters.command, text_router))
\ No newline at end of file
+    dp.add_handler(MessageHandler(_FSM_TEXT_FILTER, per_user_serial(text_router)))
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-16 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendarapp', '0003_tguser_alter_event_table'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['status', 'participant_tg_id'], name='appt_status_participant_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['organizer_tg_id', 'date', 'time'], name='appt_org_dt_idx'),
+        ),
+    ]
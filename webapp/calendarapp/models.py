@@ -204,6 +204,12 @@ class Appointment(models.Model):
         verbose_name = "Встреча"
         verbose_name_plural = "Встречи"
         ordering = ["-date", "-time", "-id"]
+        indexes = [
+            # callback «Подтвердить/Отклонить»: UPDATE ... WHERE status='pending' AND participant_tg_id=...
+            models.Index(fields=["status", "participant_tg_id"], name="appt_status_participant_idx"),
+            # занятость организатора на конкретные дату/время
+            models.Index(fields=["organizer_tg_id", "date", "time"], name="appt_org_dt_idx"),
+        ]
 
     def __str__(self) -> str:
         return (
@@ -104,6 +104,12 @@ DATABASES = {
         # ВАЖНО: 'db' для Docker, 'localhost' для локального запуска
         "HOST": os.getenv("DB_HOST", "localhost"),
         "PORT": os.getenv("DB_PORT", "5432"),
+        # Постоянные соединения: не открывать новое (TCP + auth) на каждый запрос;
+        # перед переиспользованием соединение проверяется, мёртвое — заменяется.
+        # Django делает это только на границах HTTP-запроса; потоки бота
+        # вызывают close_old_connections() сами (tgapp.core.with_fresh_db).
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", "600")),
+        "CONN_HEALTH_CHECKS": True,
         "TEST": {
             "NAME": "test_calendar_db",
         },